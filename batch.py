@@ -0,0 +1,116 @@
+"""
+Analyze many users' Takeouts at once, downloading each video's metadata only once.
+
+Every user gets the usual `<out_base>/<name>` directory with their watch events and `urls.txt`,
+while metadata is kept in a single SharedLibrary at `<out_base>/shared`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+from downloader import UNAVAILABLE_TTL
+from report import export_report
+from shared import SharedLibrary
+from store import DEFAULT_KEYS
+from takeout import video_id
+
+
+def parse_takeouts(specs):
+    """Map user names to Takeout folders.
+
+    Parameters
+    ----------
+    specs : [str]
+        Either `name=path/to/Takeout`, or just the path, in which case the user is named after
+        the folder containing the Takeout (e.g. `jill/Takeout` is 'jill').
+    """
+    takeouts = {}
+    for spec in specs:
+        name, sep, path = spec.partition('=')
+        if not sep:
+            path = spec
+            name = Path(path).expanduser().resolve().parent.name
+        if name in takeouts:
+            raise ValueError(f'Two Takeouts are named "{name}". Use name=path to tell them apart.')
+        takeouts[name] = path
+    return takeouts
+
+
+def analyze_user(name, out_base, library_path, export_dir, **options):
+    """Run and export one user's analysis from the shared library. Runs in a worker process.
+
+    `options` are passed on to the Analysis (keywords, lazy_text, approximate, profile).
+    """
+    from youtube_history import Analysis
+    shared = SharedLibrary(library_path)
+    analysis = Analysis(None, out_base, name, shared=shared, **options)
+    analysis.start_analysis()
+    return export_report(analysis, export_dir)
+
+
+def run_batch(takeouts, out_base='data', workers=8, processes=None, keywords=('funny',), export=None,
+              extractor=None, unavailable_ttl=UNAVAILABLE_TTL, keep_keys=DEFAULT_KEYS, lazy_text=False,
+              approximate=False, profile=False):
+    """Download and analyze the histories of several users.
+
+    Parameters
+    ----------
+    takeouts : {str: str}
+        Path to each user's Takeout folder, by name
+    out_base : str (default='data')
+        Directory holding each user's results and the shared library
+    workers : int (default=8)
+        Number of parallel downloads
+    processes : Optional[int]
+        Number of users analyzed at once. Defaults to the number of CPUs.
+    keywords : [str] (default=['funny'])
+        Words to count in video descriptions
+    export : Optional[str]
+        Directory to export the reports to, one subdirectory per user.
+        Defaults to `<out_base>/<name>/report`.
+    extractor : Optional[func]
+        Passed on to the Downloader
+    unavailable_ttl : Optional[float] (default=30 days)
+        Seconds before videos that couldn't be downloaded are tried again. None never retries them.
+    keep_keys : (str) (default=DEFAULT_KEYS)
+        The info.json keys kept in the shared store
+    lazy_text, approximate, profile : bool (default=False)
+        Passed on to each user's Analysis
+
+    Returns
+    -------
+    reports : {str: Path}
+        The exported index.html of each user
+    """
+    from youtube_history import Analysis
+    library = SharedLibrary(Path(out_base) / 'shared', keep_keys, unavailable_ttl)
+    all_urls = {}
+    for name, takeout in takeouts.items():
+        analysis = Analysis(takeout, out_base, name, shared=library)
+        analysis.setup_dirs()
+        urls, _ = analysis.parse_history()
+        (analysis.path / 'urls.txt').write_text('\n'.join(urls))
+        for url in urls:
+            all_urls.setdefault(video_id(url), url)
+        logger.info(f'{name} watched {len(urls)} videos.')
+    logger.info(f'{len(all_urls)} unique videos across {len(takeouts)} users.')
+    library.download(list(all_urls.values()), extractor, workers)
+    library.build_cache()
+    if not library.cache.exists():
+        logger.info('No data was downloaded.')
+        return {}
+
+    if export is None:
+        export_dirs = {name: Path(out_base) / name / 'report' for name in takeouts}
+    else:
+        export_dirs = {name: Path(export) / name for name in takeouts}
+    options = {'keywords': list(keywords), 'lazy_text': lazy_text, 'approximate': approximate, 'profile': profile}
+    reports = {}
+    with ProcessPoolExecutor(processes) as pool:
+        futures = {name: pool.submit(analyze_user, name, out_base, library.path, export_dirs[name], **options)
+                   for name in takeouts}
+        for name, future in futures.items():
+            reports[name] = future.result()
+    return reports
@@ -0,0 +1,74 @@
+"""
+Compares loading the pickled Dataframe and tags with loading the Parquet cache.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_cache --videos 100000
+"""
+
+import argparse
+import pickle
+import random
+import tempfile
+
+from benchmarks.common import measure
+from synthetic import fake_info, random_video_id
+
+
+NUMERIC = ['view_count', 'like_count', 'duration']
+
+
+def build(base, n_videos):
+    from youtube_history import Analysis
+    rng = random.Random(0)
+    analysis = Analysis(out_base=base, name='bench')
+    analysis.setup_dirs()
+    for i in range(n_videos):
+        analysis.store.append({**fake_info(rng, random_video_id(rng)), 'autonumber': i + 1})
+    analysis.store.close()
+    analysis.df_from_files()
+    analysis.df.to_pickle(analysis.ran / 'df.pkl')
+    with open(analysis.ran / 'tags.pkl', 'wb') as f:
+        pickle.dump(analysis.tags.to_lists(), f)
+    analysis.cache.save(analysis.df, analysis.tags)
+    return analysis.ran
+
+
+def load_pickle(ran):
+    import pandas as pd
+    df = pd.read_pickle(ran / 'df.pkl')
+    with open(ran / 'tags.pkl', 'rb') as f:
+        tags = pickle.load(f)
+    return df.shape, len(tags)
+
+
+def load_parquet(ran):
+    from cache import ColumnCache
+    cache = ColumnCache(ran / 'videos.parquet')
+    return cache.load().shape, len(cache.load_tags())
+
+
+def load_parquet_numeric(ran):
+    from cache import ColumnCache
+    return ColumnCache(ran / 'videos.parquet').load(NUMERIC).shape, 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--videos', type=int, default=100_000,
+                        help='Number of videos in the synthetic history.')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as base:
+        ran = build(base, args.videos)
+        sizes = {'pickle': sum((ran / f).stat().st_size for f in ('df.pkl', 'tags.pkl')),
+                 'parquet': (ran / 'videos.parquet').stat().st_size}
+        for name, size in sizes.items():
+            print(f'{name:>8} on disk: {size / 2**20:8.1f} MB')
+        stages = {'pickle': load_pickle, 'parquet': load_parquet, 'numeric': load_parquet_numeric}
+        for name, func in stages.items():
+            seconds, peak_mb, (shape, n_tags) = measure(func, ran)
+            print(f'{name:>8}: {seconds:8.3f} s  {peak_mb:8.1f} MB peak  {shape}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the memory used by the video Dataframe with object columns and with the compact dtypes.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_memory --videos 200000
+"""
+
+import argparse
+import random
+import tempfile
+
+from pathlib import Path
+
+from benchmarks.common import measure
+from synthetic import fake_info, random_video_id
+
+
+def build(base, n_videos):
+    from cache import ColumnCache
+    from ingest import columns_from_metas, frame_from_columns
+    from store import MetadataStore
+    from tags import TagStore
+    rng = random.Random(0)
+    store = MetadataStore(Path(base) / 'metadata.jsonl.gz')
+    for i in range(n_videos):
+        store.append({**fake_info(rng, random_video_id(rng)), 'autonumber': i + 1})
+    store.close()
+    df, tags = frame_from_columns(columns_from_metas(store))
+    ColumnCache(Path(base) / 'videos.parquet').save(df, TagStore.from_lists(tags))
+    return Path(base)
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def ingest_objects(base):
+    """The Dataframe as it was built before compact dtypes: object counts, urls and strings."""
+    import pandas as pd
+    from ingest import KEYS_AND_DEFAULTS, columns_from_metas
+    from store import MetadataStore
+    columns = columns_from_metas(MetadataStore(base / 'metadata.jsonl.gz'))
+    columns.pop('tags')
+    columns['webpage_url'] = ['https://www.youtube.com/watch?v=' + vid for vid in columns['id']]
+    df = pd.DataFrame(columns, columns=[k for k in KEYS_AND_DEFAULTS if k != 'id'] + ['webpage_url'], dtype=object)
+    df['upload_date'] = pd.to_datetime(df['upload_date'], format='%Y%m%d')
+    return frame_mb(df)
+
+
+def ingest_compact(base):
+    from ingest import columns_from_metas, frame_from_columns
+    from store import MetadataStore
+    df, _ = frame_from_columns(columns_from_metas(MetadataStore(base / 'metadata.jsonl.gz')))
+    return frame_mb(df)
+
+
+def load_cache(base):
+    from cache import ColumnCache
+    return frame_mb(ColumnCache(base / 'videos.parquet').load())
+
+
+def load_cache_lazy(base):
+    from cache import ColumnCache
+    from ingest import TEXT_COLUMNS
+    cache = ColumnCache(base / 'videos.parquet')
+    return frame_mb(cache.load([col for col in cache.columns if col not in TEXT_COLUMNS]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--videos', type=int, default=200_000,
+                        help='Number of videos in the synthetic history.')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as base:
+        base = build(base, args.videos)
+        stages = {'objects': ingest_objects, 'compact': ingest_compact,
+                  'cache': load_cache, 'lazy': load_cache_lazy}
+        for name, func in stages.items():
+            seconds, peak_mb, df_mb = measure(func, base)
+            print(f'{name:>8}: {seconds:8.3f} s  {peak_mb:8.1f} MB peak  {df_mb:8.1f} MB dataframe')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares the BeautifulSoup and streaming watch history parsers on a synthetic Takeout.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_parse --entries 1000000
+"""
+
+import argparse
+import tempfile
+
+from pathlib import Path
+
+from benchmarks.common import measure
+from synthetic import write_watch_history
+from takeout import WATCH_HISTORY, parse_watch_history
+
+
+def soup_path(takeout):
+    from youtube_history import Analysis
+    analysis = Analysis(takeout)
+    return analysis.parse_soup(analysis.get_soup())
+
+
+def stream_path(takeout):
+    return parse_watch_history(Path(takeout) / WATCH_HISTORY)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--entries', type=int, default=1_000_000,
+                        help='Number of watch events in the synthetic history.')
+    parser.add_argument('--skip-soup', action='store_true',
+                        help="Only time the streaming parser (the soup path needs several GB at 1M entries).")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as takeout:
+        path = write_watch_history(takeout, args.entries)
+        print(f'{args.entries} entries, {path.stat().st_size / 2**20:.1f} MB')
+        results = {'stream': measure(stream_path, takeout)}
+        if not args.skip_soup:
+            results['soup'] = measure(soup_path, takeout)
+        for name, (seconds, peak_mb, (videos, ad_count)) in results.items():
+            print(f'{name:>6}: {seconds:8.2f} s  {peak_mb:8.1f} MB peak  '
+                  f'{len(videos)} videos  {ad_count} ads')
+        if 'soup' in results:
+            same = results['soup'][2] == results['stream'][2]
+            print(f'Outputs identical: {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Times and memory-profiles every stage of an analysis of a synthetic Takeout.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_stages --entries 100000
+
+Results are written as json to `benchmarks/results/<commit>.json`. To check a change for regressions,
+run the benchmark on both commits and compare them:
+
+    $ python -m benchmarks.bench_stages --entries 100000 --compare benchmarks/results/<old commit>.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess as sp
+import tempfile
+import time
+
+from pathlib import Path
+
+from benchmarks.common import measure
+from synthetic import write_takeout
+
+
+def git_commit():
+    """The short hash of HEAD, marked dirty if there are uncommitted changes."""
+    try:
+        commit = sp.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        status = sp.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+    except (OSError, sp.CalledProcessError):
+        return 'unknown'
+    return commit.stdout.strip() + ('-dirty' if status.stdout.strip() else '')
+
+
+def run_stages(base, name, skip_soup=False, processes=None):
+    """Run each stage of an analysis in turn, returning the measurements of its Profiler.
+
+    Stages the analysis doesn't instrument itself (e.g. the soup parser) are added here.
+    """
+    from report import render_report
+    from youtube_history import Analysis
+
+    takeout = Path(base) / 'Takeout'
+    analysis = Analysis(takeout, Path(base) / 'data', name, processes=processes)
+    profiler = analysis.profiler
+    analysis.setup_dirs()
+    if not skip_soup:
+        with profiler.stage('get_soup'):
+            soup = analysis.get_soup()
+        with profiler.stage('parse_soup'):
+            analysis.parse_soup(soup)
+        del soup
+    analysis.parse_history()
+    analysis.df_from_files()
+    with profiler.stage('cache.save'):
+        analysis.cache.save(analysis.df, analysis.tags)
+
+    analysis = Analysis(takeout, Path(base) / 'data', name)
+    analysis.profiler = profiler
+    analysis.check_df()
+    analysis.check_events()
+    with profiler.stage('frame'):
+        analysis.frame
+    analysis.compute()
+    analysis.graph()
+    analysis.wordcloud_path.unlink(missing_ok=True)
+    try:
+        analysis.make_wordcloud()
+        analysis.wordcloud_image()
+    finally:
+        analysis.wordcloud_path.unlink(missing_ok=True)
+    render_report(analysis, lambda filename: filename)
+    return profiler.summary()
+
+
+def compare(results, baseline):
+    """Print the change in time and peak memory of each stage since a baseline run."""
+    before = {r['stage']: r for r in baseline['stages']}
+    print(f"\nCompared to {baseline['commit']} ({baseline['params']['entries']} entries):")
+    for r in results['stages']:
+        old = before.get(r['stage'])
+        if old is None:
+            print(f"{r['stage']:>32}: new")
+            continue
+        speedup = old['seconds'] / r['seconds'] if r['seconds'] else float('inf')
+        print(f"{r['stage']:>32}: {old['seconds']:8.3f} s -> {r['seconds']:8.3f} s ({speedup:5.2f}x)  "
+              f"{old['peak_delta_mb']:8.1f} MB -> {r['peak_delta_mb']:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--entries', type=int, default=10_000,
+                        help='Number of watch events in the synthetic history (ads and removed videos included).')
+    parser.add_argument('--full', action='store_true',
+                        help='Write complete, realistically sized info.json files instead of just the used keys.')
+    parser.add_argument('--skip-soup', action='store_true',
+                        help="Don't time the BeautifulSoup parser, which needs several GB at 1M entries.")
+    parser.add_argument('-p', '--processes', type=int,
+                        help='Number of processes reading json files. Defaults to the number of CPUs.')
+    parser.add_argument('-o', '--output',
+                        help='Where to write the json results. Defaults to benchmarks/results/<commit>.json')
+    parser.add_argument('-c', '--compare',
+                        help='Results of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as base:
+        start = time.perf_counter()
+        analysis_dir = write_takeout(base, args.entries, full=args.full)
+        n_videos = len(list((analysis_dir / 'raw').glob('*.info.json')))
+        print(f'Generated {args.entries} entries and {n_videos} info.json files '
+              f'in {time.perf_counter() - start:.1f} s')
+        _, total_peak_mb, stages = measure(run_stages, base, analysis_dir.name, args.skip_soup, args.processes)
+
+    results = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'params': {'entries': args.entries, 'videos': n_videos, 'full': args.full,
+                          'processes': args.processes},
+               'peak_mb': total_peak_mb, 'stages': stages}
+    for r in stages:
+        per_second = '' if r['per_second'] is None else f"  {r['per_second']:10.0f} items/s"
+        print(f"{r['stage']:>32}: {r['seconds']:8.3f} s  {r['cpu_seconds']:8.3f} s cpu  "
+              f"{r['peak_mb']:8.1f} MB peak  {r['peak_delta_mb']:+8.1f} MB{per_second}")
+    output = Path(args.output or f'benchmarks/results/{commit}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f'Results written to {output}')
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Times how long the report server takes to start, with and without `--serve-only`, and what is imported first.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_startup --entries 10000 --repeat 5
+
+The import time of `youtube_history` comes from `python -X importtime`, along with its slowest imports.
+Startup is the wall time from launching `youtube_history.py` until the server answers its first request:
+after a full run the data is loaded from the cache and the metrics from `ran/metrics/`,
+while `--serve-only` only reads the saved page. None of the heavy dependencies may be imported up front.
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess as sp
+import sys
+import tempfile
+import time
+import urllib.request
+
+from pathlib import Path
+
+from synthetic import write_takeout
+
+
+HEAVY = ('pandas', 'numpy', 'pyarrow', 'bs4', 'lxml', 'emoji', 'tqdm', 'wordcloud', 'matplotlib', 'plotly')
+URL = 'http://127.0.0.1:5000/'
+
+
+def import_times(module, top=8):
+    """The total import time of a module in seconds, and its `top` slowest direct and indirect imports."""
+    result = sp.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                    capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative) / 1e6, name.rstrip()))
+    total = next(seconds for seconds, name in times if name.strip() == module)
+    nested = sorted((t for t in times if t[1].strip() != module), reverse=True)
+    return total, nested[:top]
+
+
+def heavy_imports(*modules):
+    """Which of the HEAVY packages importing `modules` drags in."""
+    code = (f'import json, sys; import {", ".join(modules)}; '
+            f'print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))')
+    result = sp.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def time_to_first_response(args, timeout=120):
+    """Launch `youtube_history.py` with `args`, and time it until the server answers. The server is then stopped."""
+    env = dict(os.environ, BROWSER='true')  # Don't open a browser tab
+    start = time.perf_counter()
+    proc = sp.Popen([sys.executable, 'youtube_history.py'] + args, env=env, stdout=sp.DEVNULL, stderr=sp.DEVNULL,
+                    start_new_session=True)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f'youtube_history.py {" ".join(args)} exited with {proc.returncode}')
+            try:
+                with urllib.request.urlopen(URL, timeout=1) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f'The server did not answer within {timeout} s')
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+
+def analyze(base, name):
+    """Run the whole analysis once, so its cache, metrics and saved page are there to start from."""
+    from server import static_url
+    from youtube_history import Analysis
+
+    analysis = Analysis(Path(base) / 'Takeout', Path(base) / 'data', name)
+    analysis.run()
+    analysis.wordcloud_image()
+    analysis.render(static_url, '/wordcloud.png')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--entries', type=int, default=10_000,
+                        help='Number of watch events in the synthetic history.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times each startup is timed. The median is reported.')
+    args = parser.parse_args()
+
+    total, slowest = import_times('youtube_history')
+    print(f'import youtube_history: {total * 1000:.0f} ms')
+    for seconds, name in slowest:
+        print(f'{seconds * 1000:10.1f} ms  {name}')
+    heavy = heavy_imports('youtube_history', 'server')
+    print(f'Heavy packages imported up front: {", ".join(heavy) or "none"}')
+
+    with tempfile.TemporaryDirectory() as base:
+        analysis_dir = write_takeout(base, args.entries)
+        n_videos = len(list((analysis_dir / 'raw').glob('*.info.json')))
+        analyze(base, analysis_dir.name)
+        common = ['-o', str(Path(base) / 'data'), '-n', analysis_dir.name]
+        try:
+            for label, extra in (('full run', ['-t', str(Path(base) / 'Takeout')]), ('--serve-only', ['--serve-only'])):
+                seconds = [time_to_first_response(common + extra) for _ in range(args.repeat)]
+                print(f'{label:>14}: first response after {statistics.median(seconds):.3f} s '
+                      f'(median of {args.repeat}, {n_videos} videos)')
+        finally:
+            for image in Path('static/images').glob(f'{analysis_dir.name}_wordcloud*.png'):
+                image.unlink()
+    if heavy:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
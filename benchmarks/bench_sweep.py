@@ -0,0 +1,123 @@
+"""
+Checks the one-pass `sweep.Sweep` against the pandas metrics it replaced, and times both.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_sweep --videos 200000 --users 4
+
+Exact sweeps must match pandas video for video (up to the order of uploaders with equal counts).
+For approximate sweeps, the error of each decile edge is reported in ranks, the share of the best and worst
+videos per decile that match, and the recall of the top uploaders and languages.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from sweep import Sweep
+
+
+def synthetic_frame(n_videos, seed=0):
+    """Videos with long tailed views and uploaders, and a few languages, in the dtypes `ingest.DTYPES` uses."""
+    from ingest import compact
+    from synthetic import fake_info, random_video_id
+    rng = random.Random(seed)
+    infos = [fake_info(rng, random_video_id(rng)) for _ in range(n_videos)]
+    columns = ['view_count', 'like_count', 'uploader', 'language']
+    return compact(pd.DataFrame({col: [info.get(col) for info in infos] for col in columns}))
+
+
+def with_pandas(df):
+    """The results of the `best_and_worst_videos`, `uploader_counts` and `by_language` metrics before `Sweep`."""
+    views = df['view_count']
+    likes_pct = ((df['like_count'] / df['view_count']) * 100).fillna(0).round(4)
+    low_views = df[views < 10]
+    least_viewed = low_views.sample(min(len(low_views), 10), random_state=0)
+    grouped = likes_pct.groupby(pd.qcut(df['view_count'].fillna(0), 10, labels=False))
+    uploaders = df['uploader'].value_counts()
+    languages = df['language'].value_counts()
+    languages = languages[languages > 0].drop('', errors='ignore')
+    in_language = df['language'].isin(languages.index)
+    best_language = likes_pct[in_language].groupby(df['language'][in_language], observed=True).idxmax()
+    return {'most_viewed': views.idxmax(),
+            'least_viewed': least_viewed.index.to_numpy(),
+            'best_per_decile': grouped.idxmax().to_numpy(),
+            'worst_per_decile': grouped.idxmin().to_numpy(),
+            'uploaders': uploaders[uploaders > 0],
+            'languages': languages,
+            'best_per_language': best_language}
+
+
+def with_sweep(df, users, approximate):
+    """Sweep the frame in `users` chunks, as if each were a different user's history."""
+    sweep = Sweep(approximate)
+    for chunk in np.array_split(np.arange(len(df)), users):
+        sweep.update(df.iloc[chunk])
+    return sweep.result()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def same_counts(a, b):
+    return a.sort_index().astype(int).equals(b.drop('', errors='ignore').sort_index().astype(int))
+
+
+def check_exact(expected, swept):
+    checks = {'most_viewed': expected['most_viewed'] == swept['most_viewed'],
+              'least_viewed': np.array_equal(expected['least_viewed'], swept['least_viewed']),
+              'best_per_decile': np.array_equal(expected['best_per_decile'], swept['best_per_decile']),
+              'worst_per_decile': np.array_equal(expected['worst_per_decile'], swept['worst_per_decile']),
+              'uploaders': same_counts(expected['uploaders'], swept['uploaders']),
+              'languages': same_counts(expected['languages'], swept['languages']),
+              'best_per_language': expected['best_per_language'].equals(
+                  swept['best_per_language'].loc[expected['best_per_language'].index])}
+    for name, ok in checks.items():
+        print(f'{name:>20}: {"ok" if ok else "MISMATCH"}')
+    return all(checks.values())
+
+
+def check_approximate(df, expected, swept, k=15):
+    views = np.sort(df['view_count'].fillna(0).to_numpy(np.float64))
+    true_edges = np.quantile(views, np.linspace(0, 1, 11))
+    rank = lambda v: np.searchsorted(views, v) / len(views)  # noqa: E731
+    errors = [abs(rank(a) - rank(b)) for a, b in zip(true_edges, swept['edges'])]
+    print(f'{"decile edges":>20}: worst rank error {max(errors):.2%}')
+    for name in ('best_per_decile', 'worst_per_decile'):
+        same = np.mean(np.asarray(expected[name])[:len(swept[name])] == swept[name])
+        print(f'{name:>20}: {same:.0%} the same video')
+    for name in ('uploaders', 'languages'):
+        top = set(expected[name].head(k).index)
+        recall = len(top & set(swept[name].head(k).index)) / len(top)
+        print(f'{name:>20}: top {k} recall {recall:.0%}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--videos', type=int, default=100_000)
+    parser.add_argument('-u', '--users', type=int, default=1,
+                        help='Number of chunks the videos are swept in, as when combining several histories.')
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.videos)
+    expected, pandas_seconds = timed(with_pandas, df)
+    exact, exact_seconds = timed(with_sweep, df, args.users, False)
+    approximate, approximate_seconds = timed(with_sweep, df, args.users, True)
+    print(f'pandas: {pandas_seconds:.3f} s, exact sweep: {exact_seconds:.3f} s, '
+          f'approximate sweep: {approximate_seconds:.3f} s')
+    print('\nExact:')
+    ok = check_exact(expected, exact)
+    print('\nApproximate:')
+    check_approximate(df, expected, approximate)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
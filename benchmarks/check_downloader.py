@@ -0,0 +1,155 @@
+"""
+Checks resuming, backoff and failure recording of `downloader.Downloader` against a stub extractor, offline.
+
+Run from the repository root:
+
+    $ python -m benchmarks.check_downloader --videos 500
+
+The stub serves fake info dicts. Some videos are unavailable for good, some fail once with a temporary error,
+and some are rate limited on their first attempt. The first run is interrupted partway, like a user pressing
+Ctrl-C. The second run must fetch only what's still pending, never the videos cached as unavailable,
+and leave the videos that failed temporarily for the third, which finishes them. A fourth must fetch nothing,
+and a fifth with a TTL of 0 only the unavailable videos.
+Each check is done with one file per video and with `--store`.
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+
+from pathlib import Path
+
+from downloader import Backoff, Downloader, Manifest, RateLimited, TemporaryError, Unavailable
+from store import MetadataStore
+from synthetic import fake_info, random_video_id
+from takeout import video_id
+
+
+class StubExtractor:
+    """Serves fake info dicts without any network access.
+
+    Whether a video is unavailable, fails temporarily or is rate limited only depends on its url,
+    so every run of a check sees the same videos fail. After `stop_after` calls every call raises
+    KeyboardInterrupt instead, like a Ctrl-C stopping every worker, until `stop_after` is reset to None.
+    Raising it only once would let the other workers fetch the rest of the urls before the run notices.
+    """
+    def __init__(self, unavailable_rate=.1, temporary_rate=.1, rate_limited_rate=.1, stop_after=None):
+        self.rates = (unavailable_rate, temporary_rate, rate_limited_rate)
+        self.stop_after = stop_after
+        self.lock = threading.Lock()
+        self.calls = []
+        self.failed_once = set()
+
+    def kind(self, url):
+        """'unavailable', 'temporary', 'rate_limited' or 'ok'."""
+        draw = random.Random(url).random()
+        for kind, rate in zip(('unavailable', 'temporary', 'rate_limited'), self.rates):
+            if draw < rate:
+                return kind
+            draw -= rate
+        return 'ok'
+
+    def __call__(self, url):
+        with self.lock:
+            self.calls.append(url)
+            if self.stop_after is not None and len(self.calls) > self.stop_after:
+                raise KeyboardInterrupt
+            first_failure = url not in self.failed_once
+            self.failed_once.add(url)
+        kind = self.kind(url)
+        if kind == 'unavailable':
+            raise Unavailable('Video unavailable. This video has been removed by the uploader')
+        if kind == 'temporary' and first_failure:
+            raise TemporaryError('Unable to download webpage: HTTP Error 503: Service Unavailable')
+        if kind == 'rate_limited' and first_failure:
+            raise RateLimited('HTTP Error 429: Too Many Requests')
+        return fake_info(random.Random(url), video_id(url))
+
+
+def downloader(raw, extractor, ttl, store, sleeps):
+    """A Downloader resuming from the manifest next to `raw`, whose backoff records its delays instead of sleeping."""
+    manifest = Manifest(raw.parent / 'manifest.json', ttl)
+    store = MetadataStore(raw.parent / 'metadata.jsonl.gz') if store else None
+    backoff = Backoff(base=.01, sleep=sleeps.append)
+    return Downloader(raw, manifest, extractor, workers=4, backoff=backoff, save_every=10, store=store)
+
+
+def saved_ids(raw, store):
+    """The video id of every info dict written so far."""
+    if store:
+        return [meta['id'] for meta in MetadataStore(raw.parent / 'metadata.jsonl.gz')]
+    return [json.loads(path.read_text())['id'] for path in raw.glob('*.info.json')]
+
+
+def check(urls, store):
+    """Run every download in turn, returning whether each check passed by name."""
+    checks = {}
+    with tempfile.TemporaryDirectory() as base:
+        raw = Path(base) / 'raw'
+        raw.mkdir()
+        stub = StubExtractor(stop_after=len(urls) // 3)
+        kinds = {video_id(url): stub.kind(url) for url in urls}
+        unavailable = {vid for vid, kind in kinds.items() if kind == 'unavailable'}
+
+        sleeps = []
+        first = downloader(raw, stub, None, store, sleeps)
+        try:
+            first.run(urls)
+            checks['interrupted'] = False
+        except KeyboardInterrupt:
+            checks['interrupted'] = True
+        stub.stop_after = None
+        manifest = Manifest(raw.parent / 'manifest.json')
+        done_first = set(manifest.done)
+        checks['progress saved'] = 0 < len(done_first) < len(urls) and set(saved_ids(raw, store)) >= done_first
+        checks['only unavailable cached'] = set(manifest.failed) <= unavailable
+
+        stub.calls.clear()
+        second = downloader(raw, stub, None, store, sleeps)
+        counts = second.run(urls)
+        fetched = {video_id(url) for url in stub.calls}
+        checks['rerun skips done'] = not fetched & done_first
+        checks['rerun skips unavailable'] = not fetched & set(manifest.failed)
+        left = set(kinds) - set(second.manifest.done) - unavailable
+        checks['temporary errors left pending'] = counts['pending'] == len(left) > 0 and all(
+            kinds[vid] == 'temporary' for vid in left)
+        checks['rate limits retried with backoff'] = len(sleeps) > 0 and not any(
+            kinds[vid] == 'rate_limited' for vid in left)
+
+        third = downloader(raw, stub, None, store, sleeps)
+        third.run(urls)
+        checks['temporary errors retried'] = set(third.manifest.done) == set(kinds) - unavailable
+        checks['every video saved once'] = sorted(saved_ids(raw, store)) == sorted(third.manifest.done)
+        checks['unavailable recorded'] = set(third.manifest.failed) == unavailable
+
+        stub.calls.clear()
+        downloader(raw, stub, None, store, sleeps).run(urls)
+        checks['nothing left to fetch'] = not stub.calls
+
+        stub.calls.clear()
+        downloader(raw, stub, 0, store, sleeps).run(urls)
+        checks['unavailable retried after ttl'] = {video_id(url) for url in stub.calls} == unavailable
+    return checks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--videos', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    urls = [f'https://www.youtube.com/watch?v={random_video_id(rng)}' for _ in range(args.videos)]
+    ok = True
+    for store in (False, True):
+        print('\nStore:' if store else 'Files:')
+        for name, passed in check(urls, store).items():
+            print(f'{name:>32}: {"ok" if passed else "FAILED"}')
+            ok &= passed
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import multiprocessing as mp
+import time
+
+from profiling import peak_rss_mb
+
+
+def _measure(func, args, queue):
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    queue.put((seconds, peak_mb, result))
+
+
+def measure(func, *args):
+    """Run `func(*args)` in a fresh process so peak RSS isn't polluted by earlier runs.
+
+    Returns
+    -------
+    seconds : float
+        Wall time of the call
+    peak_mb : float
+        Peak resident memory of the process, including interpreter startup and imports
+    result
+        Whatever `func` returned. Keep it small, it's pickled back to the parent.
+    """
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(func, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
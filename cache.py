@@ -0,0 +1,86 @@
+"""
+Columnar on-disk cache of the compiled video Dataframe and tags.
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest import TEXT_COLUMNS, compact
+from metrics import row_hashes
+from tags import TagStore
+
+
+HASH_PREFIX = 'hash:'  # Columns holding the row hashes of a text column, e.g. 'hash:description'
+
+
+class ColumnCache:
+    """Stores the Dataframe and tags in a single zstd-compressed Parquet file.
+
+    Tags are kept as a list<string> column alongside the metadata, and the other columns
+    keep the compact dtypes from `ingest.DTYPES`, so nothing round trips through `object`.
+    Columns are only read when asked for, so a view that only needs view counts never
+    touches the descriptions. The text columns are saved along with a hash of each row,
+    so metrics can tell whether their saved results are current without reading the text.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the Parquet file (e.g. `ran/videos.parquet`)
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return self.path.is_file()
+
+    @property
+    def columns(self):
+        """Names of the Dataframe columns in the cache, not including tags."""
+        return [name for name in pq.read_schema(self.path).names
+                if name != 'tags' and not name.startswith(HASH_PREFIX)]
+
+    def save(self, df, tags):
+        """Write the Dataframe and its TagStore, with the row hashes of its text columns once they're compacted."""
+        df = compact(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.append_column('tags', tags.to_arrow())
+        for col in TEXT_COLUMNS:
+            if col in df:
+                table = table.append_column(HASH_PREFIX + col, pa.array(row_hashes(df[col]), pa.uint64()))
+        pq.write_table(table, self.path, compression='zstd')
+
+    def row_hashes(self, column, ids):
+        """The `metrics.row_hashes` of a text column, for the videos `ids`, without reading the text.
+
+        None if the cache was saved without them by an older version, or doesn't have all the ids.
+        """
+        name = HASH_PREFIX + column
+        if name not in pq.read_schema(self.path).names:
+            return None
+        saved = pd.read_parquet(self.path, columns=['id', name]).drop_duplicates('id').set_index('id')[name]
+        hashes = saved.reindex(ids)
+        if hashes.isna().any():
+            return None
+        return hashes.to_numpy(dtype='uint64')
+
+    def load(self, columns=None):
+        """Read the Dataframe, or just the given subset of its columns."""
+        if 'id' not in self.columns:
+            self.upgrade()
+        if columns is None:
+            columns = self.columns
+        return pd.read_parquet(self.path, columns=columns, dtype_backend='numpy_nullable')
+
+    def upgrade(self):
+        """Rewrite a cache saved by an older version, which stored urls instead of ids, with compact dtypes."""
+        df = pd.read_parquet(self.path, columns=self.columns, dtype_backend='numpy_nullable')
+        self.save(df, self.load_tags())
+
+    def load_tags_arrow(self):
+        """The tags as a single Arrow ListArray, i.e. offsets into one flat array of strings."""
+        return pq.read_table(self.path, columns=['tags']).column('tags').combine_chunks()
+
+    def load_tags(self):
+        """The tags, dictionary encoded into a TagStore."""
+        return TagStore.from_arrow(self.load_tags_arrow())
@@ -0,0 +1,74 @@
+"""
+Wordcloud of the most common tags, drawn from precomputed counts and cached by their content.
+"""
+
+import hashlib
+import json
+
+import multiprocessing as mp
+
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import pandas as pd
+
+
+WIDTH = 960
+HEIGHT = 540
+MAX_WORDS = 200
+
+_pool = None
+
+
+def frequencies(tags, n=MAX_WORDS):
+    """The `n` most common tags and their counts, from a TagStore."""
+    counts = tags.frequencies(n)
+    return counts[counts > 0]
+
+
+def save_frequencies(counts, path):
+    pd.DataFrame({'tag': counts.index.astype(str), 'count': counts.to_numpy()}).to_parquet(path)
+
+
+def load_frequencies(path):
+    table = pd.read_parquet(path)
+    return pd.Series(table['count'].to_numpy(), index=table['tag'].to_numpy())
+
+
+def content_key(counts, width=WIDTH, height=HEIGHT):
+    """A hash of everything that determines the image: the counts and its size."""
+    content = json.dumps([width, height, list(counts.index), counts.tolist()])
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+def draw(counts, path, width=WIDTH, height=HEIGHT):
+    """Lay out the tags by frequency and save the image, without tokenizing any text."""
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(width=width, height=height, relative_scaling=.5, max_words=len(counts), random_state=0)
+    wordcloud.generate_from_frequencies(counts)
+    wordcloud.to_file(path)
+    return path
+
+
+def draw_in_background(counts, path, width=WIDTH, height=HEIGHT):
+    """Start `draw` in a worker process, so the rest of the analysis doesn't wait for the layout.
+
+    Inside a worker process (e.g. a user's analysis in `batch.py`) the image is drawn right away instead:
+    multiprocessing joins a process's children when it exits, and would wait forever on an idle pool.
+
+    Returns
+    -------
+    future : Future
+        Resolves to `path` once the image is saved
+    """
+    global _pool
+    counts = {tag: int(n) for tag, n in counts.items()}
+    if mp.parent_process() is not None:
+        future = Future()
+        try:
+            future.set_result(draw(counts, path, width, height))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    if _pool is None:
+        _pool = ProcessPoolExecutor(1)
+    return _pool.submit(draw, counts, path, width, height)
@@ -0,0 +1,383 @@
+"""
+Parallel, resumable download of video metadata using yt-dlp's Python API.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from collections import Counter
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from loguru import logger
+
+from takeout import video_id
+
+
+UNAVAILABLE_TTL = 30 * 24 * 60 * 60  # Seconds before an unavailable video is tried again
+
+# Substrings of yt-dlp's error messages, checked in order, and the reason they're recorded as
+REASONS = (('Too Many Requests', 'rate_limited'),
+           ('HTTP Error 429', 'rate_limited'),
+           ('Private video', 'private'),
+           ('confirm your age', 'age_restricted'),
+           ('members', 'members_only'),
+           ('country', 'blocked'),
+           ('region', 'blocked'),
+           ('terminated', 'removed'),
+           ('removed', 'removed'),
+           ('deleted', 'removed'),
+           ('no longer available', 'removed'),
+           ('Video unavailable', 'unavailable'))
+# Reasons that won't go away by retrying soon, so the video is kept in the negative cache
+PERMANENT = ('private', 'age_restricted', 'members_only', 'blocked', 'removed', 'unavailable')
+
+
+def unavailable_reason(message, default='error'):
+    """A short reason for a yt-dlp error message: 'private', 'removed', 'blocked', ... or `default`.
+
+    Messages that aren't recognized, like timeouts, DNS failures and server errors, get the default.
+    """
+    for substring, reason in REASONS:
+        if substring in message:
+            return reason
+    return default
+
+
+class RateLimited(Exception):
+    """Raised by an extractor when the server asks us to slow down."""
+
+
+class Unavailable(Exception):
+    """Raised by an extractor when a video can't be fetched (deleted, private, blocked...)."""
+
+
+class TemporaryError(Exception):
+    """Raised by an extractor when a fetch failed for a reason that may not last (network or server errors)."""
+
+
+class YtDlpExtractor:
+    """Fetches the info dict of a single url, with one YoutubeDL instance per thread."""
+    def __init__(self, params=None):
+        self.params = {'quiet': True, 'no_warnings': True, 'skip_download': True}
+        self.params.update(params or {})
+        self.local = threading.local()
+
+    def __call__(self, url):
+        from yt_dlp import YoutubeDL
+        from yt_dlp.utils import DownloadError
+
+        ydl = getattr(self.local, 'ydl', None)
+        if ydl is None:
+            ydl = self.local.ydl = YoutubeDL(self.params)
+        try:
+            info = ydl.extract_info(url, download=False)
+        except DownloadError as e:
+            msg = str(e)
+            reason = unavailable_reason(msg)
+            if reason == 'rate_limited':
+                raise RateLimited(msg) from e
+            if reason in PERMANENT:
+                raise Unavailable(msg) from e
+            raise TemporaryError(msg) from e
+        return ydl.sanitize_info(info)
+
+
+class Backoff:
+    """Exponential backoff with jitter, shared by every worker.
+
+    When any worker is rate limited, all workers pause until the backoff window has passed.
+    """
+    def __init__(self, base=2., cap=300., sleep=time.sleep):
+        self.base = base
+        self.cap = cap
+        self.sleep = sleep
+        self.until = 0.
+        self.lock = threading.Lock()
+
+    def wait(self):
+        delay = self.until - time.monotonic()
+        if delay > 0:
+            self.sleep(delay)
+
+    def hit(self, attempt):
+        delay = min(self.cap, self.base * 2 ** attempt) * (1 + random.random())
+        with self.lock:
+            self.until = max(self.until, time.monotonic() + delay)
+        return delay
+
+
+class Manifest:
+    """Record of which video ids have been downloaded, and which failed, stored as json.
+
+    Failures are a negative cache: a video that couldn't be fetched isn't asked for again until
+    `ttl` seconds later, since deleted, private and blocked videos rarely come back.
+    Only the PERMANENT reasons are cached. Videos that failed for any other reason stay pending.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the manifest file
+    ttl : Optional[float] (default=UNAVAILABLE_TTL)
+        Seconds before a failed video is retried. None never retries them.
+
+    Attributes
+    ----------
+    done : {str: str}
+        Video id to the name of its autonumbered info.json file in the raw directory (or of the store)
+    failed : {str: dict}
+        Video id to the 'reason' it couldn't be downloaded (see `unavailable_reason`),
+        yt-dlp's error 'message', and the time it failed ('at', in seconds since the epoch)
+    numbers : {int: str}
+        Autonumber of each downloaded video to its id, so files can be matched to videos without relying on their order
+    last_number : int
+        The highest autonumber given to a downloaded video so far
+    """
+    def __init__(self, path, ttl=UNAVAILABLE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.done = {}
+        self.failed = {}
+        self.numbers = {}
+        self.last_number = 0
+        if path.is_file():
+            saved = json.loads(path.read_text())
+            self.done = saved.get('done', {})
+            self.last_number = saved.get('last_number', 0)
+            self.numbers = {int(n): vid for n, vid in saved.get('numbers', {}).items()}
+            # Manifests without numbers can still recover them from the names of the files
+            for vid, filename in self.done.items():
+                if filename[0].isdigit():
+                    self.numbers.setdefault(int(filename.split('.')[0]), vid)
+            # Older manifests only kept the message, so their failures date from the last save.
+            # They also cached every failure, so the ones that may have been temporary are retried.
+            saved_at = path.stat().st_mtime
+            for vid, failure in saved.get('failed', {}).items():
+                if isinstance(failure, str):
+                    failure = {'reason': unavailable_reason(failure), 'message': failure, 'at': saved_at}
+                if failure['reason'] in PERMANENT:
+                    self.failed[vid] = failure
+
+    def is_unavailable(self, vid, now=None):
+        """Whether `vid` failed recently enough that it shouldn't be fetched again yet."""
+        failure = self.failed.get(vid)
+        if failure is None:
+            return False
+        if self.ttl is None:
+            return True
+        return (time.time() if now is None else now) - failure['at'] < self.ttl
+
+    def pending(self, urls, retry_failed=False):
+        """(index, url) pairs in `urls` that still need to be fetched, once per video id.
+
+        Videos in the negative cache are skipped, unless their failure is older than `ttl` or `retry_failed` is set.
+        """
+        now = time.time()
+        seen = set()
+        todo = []
+        for i, url in enumerate(urls):
+            vid = video_id(url)
+            if vid in seen or vid in self.done or (not retry_failed and self.is_unavailable(vid, now)):
+                continue
+            seen.add(vid)
+            todo.append((i, url))
+        return todo
+
+    def unavailable_counts(self):
+        """Number of videos in the negative cache for each reason."""
+        return Counter(failure['reason'] for vid, failure in self.failed.items() if self.is_unavailable(vid))
+
+    def video_at(self, number):
+        """The id of the video downloaded with this autonumber (e.g. 42 for `00042.info.json`)."""
+        return self.numbers.get(number)
+
+    def mark_done(self, vid, filename, number):
+        with self.lock:
+            self.failed.pop(vid, None)
+            self.done[vid] = filename
+            self.numbers[number] = vid
+            self.last_number = max(self.last_number, number)
+
+    def mark_failed(self, vid, message):
+        """Add a video to the negative cache. Its reason is 'unavailable' if the message isn't recognized."""
+        with self.lock:
+            self.failed[vid] = {'reason': unavailable_reason(message, 'unavailable'), 'message': message,
+                                'at': time.time()}
+
+    def save(self):
+        with self.lock:
+            text = json.dumps({'done': self.done, 'failed': self.failed, 'numbers': self.numbers,
+                               'last_number': self.last_number})
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(text)
+        os.replace(tmp, self.path)
+
+
+class YtDlpLog:
+    """Records what a `yt-dlp` subprocess downloaded, and what it failed to, from its output.
+
+    yt-dlp only logs errors when run with `-i`, so this is how the manifest learns which videos are unavailable,
+    and which autonumbered file holds each video. Rate limits and other temporary errors leave the video pending.
+    """
+    VIDEO = re.compile(r'^\[youtube\] ([\w-]{11}): ')
+    WRITTEN = re.compile(r'Writing video metadata as JSON to: (.+)$')
+    ERROR = re.compile(r'^ERROR: \[youtube\] ([\w-]{11}): (.*)$')
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.current = None
+
+    def read(self, line):
+        """Update the manifest from one line of output. Returns 'done' or 'failed' when a video finishes."""
+        error = self.ERROR.match(line)
+        if error:
+            vid, message = error.groups()
+            if unavailable_reason(message) not in PERMANENT:
+                return None
+            self.manifest.mark_failed(vid, message)
+            return 'failed'
+        video = self.VIDEO.match(line)
+        if video:
+            self.current = video.group(1)
+            return None
+        written = self.WRITTEN.search(line)
+        if written and self.current is not None:
+            filename = os.path.basename(written.group(1))
+            self.manifest.mark_done(self.current, filename, int(filename.split('.')[0]))
+            return 'done'
+        return None
+
+
+class Downloader:
+    """Shards a list of urls across a pool of threads, writing one info.json per video.
+
+    Files are named after the position of the url in the list, plus an offset (`00001.info.json`, ...),
+    matching yt-dlp's `%(autonumber)s` naming. The manifest maps each number back to its video.
+
+    Parameters
+    ----------
+    raw : Path
+        Directory where info.json files are written
+    manifest : Manifest
+        Progress record, saved periodically so an interrupted run can be resumed
+    extractor : Optional[func]
+        Callable taking a url and returning an info dict. Defaults to a YtDlpExtractor.
+        It should raise RateLimited, Unavailable or TemporaryError on failure.
+    workers : int (default=8)
+        Number of concurrent downloads
+    max_retries : int (default=5)
+        Number of rate limited attempts before giving up on a video for this run
+    backoff : Optional[Backoff]
+        Shared backoff state
+    save_every : int (default=100)
+        Number of completed videos between manifest saves
+    store : Optional[MetadataStore]
+        If given, trimmed metadata is appended to this store instead of one file per video
+    on_done : Optional[func]
+        Called from the worker thread with each video's info dict once it's saved, e.g. to ingest it right away
+    """
+    def __init__(self, raw, manifest, extractor=None, workers=8, max_retries=5, backoff=None, save_every=100,
+                 store=None, on_done=None):
+        self.raw = raw
+        self.manifest = manifest
+        self.extractor = YtDlpExtractor() if extractor is None else extractor
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = Backoff() if backoff is None else backoff
+        self.save_every = save_every
+        self.store = store
+        self.on_done = on_done
+
+    def write(self, number, info):
+        info['autonumber'] = number
+        if self.store is not None:
+            self.store.append(info)
+            return self.store.path.name
+        filename = f'{number:05d}.info.json'
+        tmp = self.raw / (filename + '.part')
+        with open(tmp, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp, self.raw / filename)
+        return filename
+
+    def fetch(self, number, url):
+        """Download a single video, returning 'done', 'failed' or 'pending'."""
+        vid = video_id(url)
+        for attempt in range(self.max_retries + 1):
+            self.backoff.wait()
+            try:
+                info = self.extractor(url)
+            except RateLimited:
+                delay = self.backoff.hit(attempt)
+                logger.info(f'Rate limited on {vid}, backing off {delay:.0f}s.')
+                continue
+            except Unavailable as e:
+                self.manifest.mark_failed(vid, str(e))
+                return 'failed'
+            except TemporaryError as e:
+                logger.warning(f'Could not fetch {vid}, leaving it for the next run: {e}')
+                return 'pending'
+            self.manifest.mark_done(vid, self.write(number, info), number)
+            if self.on_done is not None:
+                self.on_done(info)
+            return 'done'
+        return 'pending'
+
+    def checkpoint(self):
+        """Save progress. The store is flushed first so the manifest never lists unwritten videos."""
+        if self.store is not None:
+            self.store.flush()
+        self.manifest.save()
+
+    def consume(self, todo):
+        """Fetch (number, url) pairs from a queue until it yields None. Run one of these per worker thread.
+
+        Returns
+        -------
+        counts : {str: int}
+            Number of videos this worker left 'done', 'failed' or still 'pending'
+        """
+        counts = {'done': 0, 'failed': 0, 'pending': 0}
+        while True:
+            item = todo.get()
+            if item is None:
+                return counts
+            counts[self.fetch(*item)] += 1
+
+    def run(self, urls, retry_failed=False, offset=0):
+        """Fetch every url not already in the manifest.
+
+        The url at position i is numbered `offset + i + 1`. Pass the manifest's `last_number`
+        as the offset when adding videos to an existing download, so numbers don't collide.
+
+        Returns
+        -------
+        counts : {str: int}
+            Number of videos that ended up 'done', 'failed' or still 'pending'
+        """
+        todo = self.manifest.pending(urls, retry_failed)
+        logger.info(f'{len(urls) - len(todo)} videos already fetched or unavailable, {len(todo)} to go.')
+        unavailable = self.manifest.unavailable_counts()
+        if unavailable and not retry_failed:
+            reasons = ', '.join(f'{n} {reason}' for reason, n in unavailable.most_common())
+            logger.info(f'Skipping videos that were unavailable last time: {reasons}.')
+        counts = {'done': 0, 'failed': 0, 'pending': 0}
+        pool = ThreadPoolExecutor(self.workers)
+        try:
+            futures = [pool.submit(self.fetch, offset + i + 1, url) for i, url in todo]
+            for n, future in enumerate(as_completed(futures), 1):
+                counts[future.result()] += 1
+                if n % self.save_every == 0:
+                    self.checkpoint()
+                    logger.info(f'{n}/{len(todo)} videos processed.')
+        finally:
+            pool.shutdown(cancel_futures=True)
+            self.checkpoint()
+            if self.store is not None:
+                self.store.close()
+        return counts
@@ -1,17 +1,17 @@
+import json
+
 import numpy as np
 
 import plotly
 import plotly.graph_objs as go
 
-from collections import Counter
-
 
-def flatten_without_nones(seq):
-    flat = []
-    for nested in seq:
-        if nested is not None:
-            flat += nested
-    return flat
+def histogram(values, bins=50, **kwargs):
+    """A bar trace of values binned with NumPy, so only the bin counts are sent to the browser."""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    return go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=edges[1] - edges[0], **kwargs)
 
 
 class Grapher():
@@ -21,32 +21,36 @@ class Grapher():
     ----------
     df : Dataframe
         Users youtube data
-    tags : [[str]]
-        A list of tags for each downloaded video
+    tags : TagStore
+        The tags of each downloaded video
         
     Attributes
     ----------
-    plot : func
-        Alias for plotly's main plotting function
     avg_rate_plot : str
-        html <div> of a plotly histogram of the average ratings for each video
+        JSON plotly figure of a histogram of the like percentage of each video
     duration : str
-        html <div> of a plotly histogram of video durations on a log scale
+        JSON plotly figure of a histogram of video durations on a log scale
     views_plot : str
-        html <div> of a plotly histogram of video views on a log scale
+        JSON plotly figure of a histogram of video views on a log scale
     tags_plot : str
-        html <div> of a plotly scatterplot of most common rollings tags
+        JSON plotly figure of a scatterplot of most common rollings tags
+
+    The page loads plotly.js once and draws each figure with `Plotly.newPlot`.
     """
     def __init__(self, df, tags):
         self.df = df
         self.tags = tags
         
-        self.plot = plotly.offline.plot
         self.avg_rate_plot = None
         self.duration_plot = None
         self.views_plot = None
         self.tags_plot = None        
-        
+
+    def plot(self, fig):
+        """Serialize a figure to JSON that is safe to embed in a <script> tag."""
+        spec = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+        return spec.replace('</', '<\\/')
+
     def make_log_data(self, series, dec=2):
         """Log10 transforms all data before plotting.
         
@@ -66,7 +70,7 @@ class Grapher():
         ticks_txt : ndarray
             Tick labels, on log scale, at each of the tick positions"""
         log = np.log10(series.astype(float))
-        ticks = np.linspace(min(log), max(log), 10)
+        ticks = np.linspace(log.min(), log.max(), 10)
         ticks_txt = np.round(np.power(10, ticks), decimals=dec)
         return log, ticks, ticks_txt
 
@@ -92,19 +96,19 @@ class Grapher():
         return num_str
         
     def average_rating(self):
-        data = [go.Histogram(x=self.df["likes_pct"],
-                             marker=dict(color='#673AB7'))]
+        data = [histogram(self.df["likes_pct"],
+                          marker=dict(color='#673AB7'))]
         layout = dict(title='All Rating',
                       xaxis = dict(title = 'Like %'),
                       yaxis = dict(title = 'Count'))
         fig = dict(data=data, layout=layout)
-        self.avg_rate_plot = self.plot(fig,  output_type='div')
+        self.avg_rate_plot = self.plot(fig)
     
     def duration(self):  
         has_duration = self.df["duration"].dropna()
         dur, ticks, ticks_txt = self.make_log_data(has_duration / 60)
-        data = [go.Histogram(x=dur,
-                             marker=dict(color='#673AB7'))]
+        data = [histogram(dur,
+                          marker=dict(color='#673AB7'))]
         layout = dict(title='All Durations',
                       yaxis = dict(title = 'Count'),
                       xaxis = dict(title = 'Duration (min)',
@@ -112,14 +116,14 @@ class Grapher():
                                    tickvals=ticks,
                                    ticktext=ticks_txt))
         fig = dict(data=data, layout=layout)
-        self.duration_plot = self.plot(fig,  output_type='div')
+        self.duration_plot = self.plot(fig)
         
     def views(self):
         view_counts = self.df["view_count"].dropna().replace(0, 1)
         views, ticks, ticks_txt = self.make_log_data(view_counts, 0)
         ticks_txt = [self.humanize(t) for t in ticks_txt]
-        data = [go.Histogram(x=views,
-                             marker=dict(color='#673AB7'))]
+        data = [histogram(views,
+                          marker=dict(color='#673AB7'))]
         layout = dict(title='All View Counts',
                       yaxis = dict(title = 'Views'),
                       xaxis = dict(title = 'Count',
@@ -127,29 +131,34 @@ class Grapher():
                                    tickvals=ticks,
                                    ticktext=ticks_txt))
         fig = dict(data=data, layout=layout)
-        self.views_plot = self.plot(fig, output_type='div')
+        self.views_plot = self.plot(fig)
         
     def get_max_tags_and_vals(self):
         """Finds the rolling tags and their value counts over chunks of 100 videos
-        
+
+        Every (chunk, tag code) pair is counted in a single vectorized pass over the TagStore. Ties go to the tag that appears first in the chunk, like Counter.most_common.
+
         Returns
         -------
         max_tags : [str]
-            Most popular tags in each chunk of videos
+            Most popular tags in each chunk of videos ('' if a chunk has no tags)
         max_values : [int]
             The number of times the most popular tag appears
         """
-        max_tags = []
-        max_values = []
-        chunk_starts = [i for i in range(0, len(self.tags), 100)]
-        
-        for i in chunk_starts:
-            chunk = flatten_without_nones(self.tags[i:i+100])
-            counted_chunk = Counter(chunk)
-            top = counted_chunk.most_common(1)
-            max_tags.append(top[0][0])
-            max_values.append(top[0][1]) 
-        return max_tags, max_values
+        n_chunks = -(-len(self.tags) // 100)
+        max_tags = np.full(n_chunks, '', dtype=object)
+        max_values = np.zeros(n_chunks, dtype=np.int64)
+        codes, vocab = self.tags.codes, self.tags.vocab
+        if len(vocab):
+            chunks = self.tags.rows // 100
+            pairs, first, counts = np.unique(chunks * len(vocab) + codes, return_index=True, return_counts=True)
+            pair_chunks, pair_codes = np.divmod(pairs, len(vocab))
+            # Sort by chunk, then most common, then first seen. The first row of each chunk wins.
+            order = np.lexsort((first, -counts, pair_chunks))
+            best = order[np.r_[True, np.diff(pair_chunks[order]) != 0]]
+            max_tags[pair_chunks[best]] = vocab[pair_codes[best]]
+            max_values[pair_chunks[best]] = counts[best]
+        return list(max_tags), max_values.tolist()
 
     def gen_tags_plot(self):
         chunk_starts = [i for i in range(0, len(self.tags), 100)]
@@ -163,5 +172,5 @@ class Grapher():
                       yaxis = dict(title = 'Tag Count'),
                       xaxis = dict(title = 'Position of first video in history'))
         fig = dict(data=data, layout=layout)
-        self.tags_plot = self.plot(fig, output_type='div')
+        self.tags_plot = self.plot(fig)
         
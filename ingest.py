@@ -0,0 +1,168 @@
+"""
+Parallel ingestion of downloaded info.json files into columns.
+"""
+
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+from tqdm import tqdm
+
+from takeout import video_ids
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+KEYS_AND_DEFAULTS = {"like_count": pd.NA,
+                     "comment_count": pd.NA,
+                     "duration": pd.NA,
+                     "view_count": pd.NA,
+                     "upload_date": pd.NaT,
+                     "description": "",
+                     "height": pd.NA,
+                     "title": "",
+                     "id": "",
+                     "uploader": "",
+                     "language": ""}
+
+ARROW_STRING = pd.StringDtype('pyarrow')
+
+# Counts that can't overflow 32 bits are Int32, strings repeated across videos are categoricals,
+# and free text is kept in contiguous Arrow buffers instead of one Python object per cell.
+DTYPES = {"like_count": "Int64",
+          "comment_count": "Int32",
+          "duration": "Int32",
+          "view_count": "Int64",
+          "height": "Int32",
+          "description": ARROW_STRING,
+          "title": ARROW_STRING,
+          "id": ARROW_STRING,
+          "uploader": "category",
+          "language": "category"}
+
+# Columns that are only read by text metrics, and can be left out until one asks for them.
+TEXT_COLUMNS = ("description",)
+
+
+def columns_from_metas(metas):
+    """Collect the kept keys of each info dict into one list per column, plus a 'tags' column."""
+    columns = {k: [] for k in KEYS_AND_DEFAULTS}
+    columns['tags'] = []
+    for meta in metas:
+        for k, d in KEYS_AND_DEFAULTS.items():
+            columns[k].append(meta.get(k, d))
+        columns['tags'].append(meta.get('tags', []))
+    return columns
+
+
+def read_files(paths):
+    """Load a chunk of info.json files into columns."""
+    def metas():
+        for path in paths:
+            with open(path, 'rb') as f:
+                yield loads(f.read())
+    return columns_from_metas(metas())
+
+
+def read_files_parallel(paths, processes=None, chunk_size=500):
+    """Load info.json files into columns, splitting the work across a pool of processes.
+
+    Parameters
+    ----------
+    paths : [Path]
+        The files to read, in the order their rows should appear
+    processes : Optional[int]
+        Size of the pool. Defaults to the number of CPUs.
+    chunk_size : int (default=500)
+        Number of files handed to a worker at a time
+
+    Returns
+    -------
+    columns : {str: list}
+        One list per kept key, plus 'tags'
+    """
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(chunks) <= 1:
+        return read_files(paths)
+    columns = {k: [] for k in KEYS_AND_DEFAULTS}
+    columns['tags'] = []
+    with ProcessPoolExecutor(processes) as pool:
+        with tqdm(total=len(paths)) as progress:
+            for part in pool.map(read_files, chunks):
+                for k, values in part.items():
+                    columns[k] += values
+                progress.update(len(part['tags']))
+    return columns
+
+
+def to_nullable(series, dtype='Int64'):
+    """Convert a column of numbers and NAs to a nullable integer dtype.
+
+    Values that don't fit in `dtype` widen the column to Int64, and fractional ones to Float64.
+    """
+    numeric = pd.to_numeric(series, errors='coerce')
+    for candidate in (dtype, 'Int64'):
+        try:
+            return numeric.astype(candidate)
+        except TypeError:
+            pass
+    return numeric.astype('Float64')
+
+
+def convert(series, dtype):
+    """Convert a single column to `dtype`, unless it's already stored that way."""
+    if series.dtype == dtype:
+        return series
+    if str(dtype).startswith('Int'):
+        return to_nullable(series, dtype)
+    return series.astype(dtype)
+
+
+def compact(df):
+    """Convert a video Dataframe to the dtypes in `DTYPES`.
+
+    Frames from older versions, which kept the full `webpage_url` of each video, get an `id` column instead.
+    """
+    if 'id' not in df and 'webpage_url' in df:
+        df = df.assign(id=video_ids(df['webpage_url'].astype(object))).drop(columns='webpage_url')
+    return df.assign(**{col: convert(df[col], dtype) for col, dtype in DTYPES.items() if col in df})
+
+
+def arrow_strings(values, chunk_size=10_000):
+    """Move a list of strings into an Arrow string Series, emptying the list as it goes.
+
+    Each chunk of Python strings is freed as soon as it's copied, so the text is never held twice.
+    The copies use the system allocator, which can reuse the memory the freed strings leave behind.
+    """
+    chunks = []
+    while values:
+        chunks.append(pa.array(values[-chunk_size:], pa.large_string(), memory_pool=pa.system_memory_pool()))
+        del values[-chunk_size:]
+    chunks = chunks[::-1] or [pa.array([], pa.large_string())]
+    return pd.Series(pa.chunked_array(chunks), dtype=ARROW_STRING)
+
+
+def frame_from_columns(columns):
+    """Build the video Dataframe, with compact dtypes, and list of tags from columns.
+
+    Each list is converted and released before the next one, so the whole frame never exists as Python objects.
+    """
+    tags = columns.pop('tags')
+    data = {}
+    for col in KEYS_AND_DEFAULTS:
+        if DTYPES.get(col) == ARROW_STRING:
+            data[col] = arrow_strings(columns.pop(col))
+        else:
+            values = pd.Series(columns.pop(col), dtype=object)
+            data[col] = convert(values, DTYPES[col]) if col in DTYPES else values
+    data['upload_date'] = pd.to_datetime(data['upload_date'], format='%Y%m%d')
+    return pd.DataFrame(data, copy=False), tags
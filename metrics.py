@@ -0,0 +1,198 @@
+"""
+Registry of lazily computed, disk-memoized analysis metrics.
+
+A metric is a method of Analysis decorated with `metric`, declaring the dataframe columns it reads
+and the attributes it produces. Accessing any of those attributes computes the metric on first use.
+Results are saved in `ran/metrics/`, keyed by a fingerprint of the declared columns (and of the
+metric's own source and the HELPERS modules), so later runs reuse them until the data or the code changes.
+"""
+
+import hashlib
+import inspect
+import os
+import pickle
+
+from functools import lru_cache
+from pathlib import Path
+
+from loguru import logger
+
+
+ROOT = Path(__file__).parent
+# Modules of the helpers that metrics compute their results with. A change to any of them invalidates saved results.
+HELPERS = ('metrics', 'sweep', 'textscan', 'timeseries', 'takeout')
+
+
+def row_hashes(obj):
+    """A uint64 hash of each row of a Series or DataFrame's values."""
+    import pandas as pd
+    return pd.util.hash_pandas_object(obj, index=False).to_numpy()
+
+
+def fingerprint(obj):
+    """A stable hash of a Series or DataFrame's values."""
+    return fingerprint_hashes(row_hashes(obj))
+
+
+def fingerprint_hashes(hashes):
+    """The `fingerprint` of the values whose `row_hashes` are `hashes`."""
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def helpers_fingerprint():
+    """A hash of the source of every module in HELPERS."""
+    sha = hashlib.sha1()
+    for name in HELPERS:
+        sha.update((ROOT / f'{name}.py').read_bytes())
+    return sha.hexdigest()
+
+
+def likes_pct(df):
+    return ((df["like_count"] / df["view_count"]) * 100).fillna(0).round(4)
+
+
+def deciles(df):
+    import pandas as pd
+    from sweep import decile_codes
+    return pd.Series(decile_codes(df['view_count'].fillna(0)), index=df.index)
+
+
+def comment_to_view(df):
+    return df["comment_count"] / df["view_count"]
+
+
+def watch_url(df):
+    return 'https://www.youtube.com/watch?v=' + df['id']
+
+
+DERIVED = {'likes_pct': likes_pct, 'deciles': deciles, 'comment_to_view': comment_to_view,
+           'webpage_url': watch_url}
+
+
+class Rows:
+    """A selection of dataframe rows by position, stored in place of the rows themselves.
+
+    Metrics return Rows so that their cached results only depend on the columns they read;
+    the rows are looked up in the current dataframe when the result is accessed.
+    """
+    def __init__(self, positions, columns=None, reset_index=False):
+        self.positions = positions
+        self.columns = columns
+        self.reset_index = reset_index
+
+    def resolve(self, frame):
+        if self.columns is not None:
+            frame = frame[self.columns]
+        rows = frame.iloc[self.positions]
+        return rows.reset_index() if self.reset_index else rows
+
+
+def resolve(value, frame):
+    """Replace any Rows in a metric result with the rows they select."""
+    if isinstance(value, Rows):
+        return value.resolve(frame)
+    if isinstance(value, dict):
+        return {k: resolve(v, frame) for k, v in value.items()}
+    return value
+
+
+class Metric:
+    """Wraps a metric method. Calling it computes (or loads) the metric and sets its attributes."""
+    def __init__(self, func, columns, returns, params=(), events=False):
+        self.func = func
+        self.name = func.__name__
+        self.columns = list(columns)
+        self.returns = tuple(returns)
+        self.params = tuple(params)
+        self.events = events
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        owner.metrics = {**getattr(owner, 'metrics', {}), name: self}
+        for attr in self.returns:
+            setattr(owner, attr, MetricAttribute(self, attr))
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return lambda: self.compute(instance)
+
+    def key(self, analysis):
+        parts = [inspect.getsource(self.func), helpers_fingerprint()]
+        parts += [analysis.column_fingerprint(col) for col in self.columns]
+        parts += [repr(getattr(analysis, param)) for param in self.params]
+        if self.events:
+            parts.append(analysis.events_fingerprint())
+        return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+    def compute(self, analysis):
+        """Load the saved results if their key still matches, else compute them. Only then are missing columns loaded."""
+        key = self.key(analysis)
+        path = analysis.ran / 'metrics' / f'{self.name}.pkl'
+        results = self.load(path, key)
+        if results is None:
+            logger.info(f'Computing {self.name}')
+            analysis.require(self.columns)
+            results = self.func(analysis)
+            self.save(path, key, results)
+        for attr in self.returns:
+            analysis.__dict__[attr] = resolve(results[attr], analysis.frame)
+
+    def load(self, path, key):
+        """The results saved at `path`, or None if there are none for this key.
+
+        A file that can't be unpickled, e.g. because a run was killed while writing it, counts as missing.
+        """
+        if not path.is_file():
+            return None
+        try:
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved['key'] != key:
+                return None
+            return saved['results']
+        except Exception as e:
+            logger.warning(f'Ignoring the saved results of {self.name}, which can\'t be read: {e!r}')
+            return None
+
+    def save(self, path, key, results):
+        """Pickle the results next to `path` first, then move them in place, so a killed run never leaves half a file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump({'key': key, 'results': results}, f)
+        os.replace(tmp, path)
+
+
+class MetricAttribute:
+    """Computes its metric the first time the attribute is read.
+
+    The results are stored on the instance, which shadows this (non-data) descriptor afterwards.
+    """
+    def __init__(self, metric, attr):
+        self.metric = metric
+        self.attr = attr
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        self.metric.compute(instance)
+        return instance.__dict__[self.attr]
+
+
+def metric(*columns, returns, params=(), events=False):
+    """Register an Analysis method as a metric.
+
+    Parameters
+    ----------
+    *columns : str
+        Dataframe columns the metric reads. Changes to other columns don't invalidate it.
+    returns : (str)
+        Attributes set from the dict the method returns
+    params : (str)
+        Analysis attributes, like `keywords`, that change the result
+    events : bool (default=False)
+        Whether the metric reads the watch events
+    """
+    return lambda func: Metric(func, columns, returns, params, events)
@@ -0,0 +1,253 @@
+"""
+Streaming analysis that overlaps parsing, downloading, ingestion and reporting.
+
+    parse thread --(urls, bounded)--> download workers --(metadata, bounded)--> ingest (main thread)
+                                                                                     |
+                                                                   partial report every `refresh` seconds
+
+Memory is bounded by the two queues plus the compact dataframe of what has been ingested so far.
+Batches are concatenated onto the dataframe only when a report needs it, so ingestion stays linear in the history.
+"""
+
+import queue
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from loguru import logger
+
+from downloader import Downloader
+from ingest import columns_from_metas, compact, frame_from_columns
+from report import export_report
+from store import DEFAULT_KEYS, project
+from tags import TagStore
+from takeout import read_watch_events, video_id
+
+
+DONE = object()
+
+
+class Pipeline:
+    """Downloads and analyzes a Takeout at the same time, so results show up long before the last video.
+
+    Parameters
+    ----------
+    analysis : Analysis
+        The analysis to fill in. Its dataframe, tags and events are replaced as data arrives.
+    extractor : Optional[func]
+        Passed on to the Downloader
+    workers : int (default=8)
+        Number of download threads
+    queue_size : int (default=1000)
+        Capacity of the url and metadata queues. Parsing and downloading wait when they're full.
+    batch_size : int (default=500)
+        Number of downloaded videos ingested into the dataframe at a time
+    refresh : float (default=60.)
+        Seconds between partial reports
+    report_dir : Optional[Path]
+        Where partial reports are exported. Defaults to `<analysis.path>/partial`.
+
+    Attributes
+    ----------
+    positions : {str: int}
+        Position in the history of every video id parsed so far
+    counts : {str: int}
+        Number of videos 'done', 'failed' or still 'pending' once the download is over
+    """
+    def __init__(self, analysis, extractor=None, workers=8, queue_size=1000, batch_size=500, refresh=60.,
+                 report_dir=None):
+        self.analysis = analysis
+        self.workers = workers
+        self.batch_size = batch_size
+        self.refresh = refresh
+        self.report_dir = analysis.path / 'partial' if report_dir is None else report_dir
+        self.manifest = analysis.open_manifest()
+        self.offset = self.manifest.last_number
+        store = None if analysis.keep_keys is None else analysis.store
+        self.downloader = Downloader(analysis.raw, self.manifest, extractor, workers=workers, store=store,
+                                     on_done=self.downloaded)
+        self.keys = tuple(analysis.keep_keys or DEFAULT_KEYS)
+        self.todo = queue.Queue(queue_size)
+        self.metas = queue.Queue(queue_size)
+        self.positions = {}
+        self.urls = []
+        self.events = None
+        self.counts = {'done': 0, 'failed': 0, 'pending': 0}
+        self.error = None
+        self.stopped = False
+        self.df = None
+        self.tags = None
+        self.parts = []  # (df, tags) of each batch ingested since the last `combine`
+
+    def parsed(self, url):
+        """Number a newly parsed url, and queue it for download unless it's been fetched before or is unavailable.
+
+        Numbers continue from the last run's, so a newer Takeout never reuses the file of a different video.
+        """
+        vid = video_id(url)
+        self.urls.append(url)
+        if vid in self.positions:
+            return
+        self.positions[vid] = len(self.positions)
+        if vid not in self.manifest.done and not self.manifest.is_unavailable(vid):
+            self.put((self.offset + len(self.positions), url))
+
+    def put(self, item):
+        """Queue an item for the download workers, giving up if the queue stays full after one of them failed."""
+        while True:
+            try:
+                return self.todo.put(item, timeout=1)
+            except queue.Full:
+                if self.error is not None:
+                    raise RuntimeError('A download worker stopped.') from self.error
+
+    def downloaded(self, info):
+        """Queue a video's metadata for ingestion, giving up if the ingest loop has stopped."""
+        if not self.put_meta(project(info, self.keys)):
+            raise RuntimeError('Ingestion stopped.')
+
+    def put_meta(self, meta):
+        """Queue metadata, or DONE, for the ingest loop. Returns False if the loop stopped while the queue was full."""
+        while True:
+            try:
+                self.metas.put(meta, timeout=1)
+                return True
+            except queue.Full:
+                if self.stopped:
+                    return False
+
+    def work(self):
+        """Run one download worker, recording its error so parsing doesn't wait on a full queue forever."""
+        try:
+            return self.downloader.consume(self.todo)
+        except Exception as e:
+            self.error = e
+            raise
+
+    def produce(self):
+        """Parse the history into the url queue, then wait for the download workers to drain it.
+
+        Runs in its own thread. Whatever happens, the ingest loop is sent a final DONE.
+        """
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                futures = [pool.submit(self.work) for _ in range(self.workers)]
+                try:
+                    start = time.perf_counter()
+                    self.events = read_watch_events(self.analysis.watch_history(), on_url=self.parsed)
+                    logger.info(f'Parsed {len(self.urls)} videos in {time.perf_counter() - start:.2f}s, '
+                                f'{self.todo.qsize()} still queued for download.')
+                finally:
+                    for _ in futures:
+                        self.put(None)
+                for future in futures:
+                    for status, n in future.result().items():
+                        self.counts[status] += n
+        except Exception as e:
+            self.error = e
+        finally:
+            self.put_meta(DONE)
+
+    def ingest(self, metas):
+        """Turn a batch of info dicts into a dataframe and tags, to be added by `combine`."""
+        if not metas:
+            return
+        with self.analysis.profiler.stage('ingest', items=len(metas)):
+            df, tags = frame_from_columns(columns_from_metas(metas))
+            self.parts.append((df, TagStore.from_lists(tags)))
+        self.downloader.checkpoint()
+
+    def combine(self):
+        """Concatenate the batches ingested since the last call onto the dataframe and tags, in one go."""
+        if not self.parts:
+            return
+        parts = [(self.df, self.tags)] + self.parts if self.df is not None else self.parts
+        with self.analysis.profiler.stage('combine', items=sum(len(df) for df, _ in self.parts)):
+            self.df = compact(pd.concat([df for df, _ in parts], ignore_index=True))
+            self.tags = TagStore.concat([tags for _, tags in parts])
+        self.parts = []
+
+    def publish(self):
+        """Hand everything ingested so far to the analysis, in history order."""
+        self.combine()
+        analysis = self.analysis
+        analysis.df, analysis.tags = analysis.order_by_history(self.df, self.tags, self.positions.copy())
+        if self.events is not None:
+            analysis.events = self.events
+
+    def partial_report(self):
+        """Export a report of the videos ingested so far. A failure is logged, not raised."""
+        if self.df is None and not self.parts:
+            return
+        self.publish()
+        try:
+            self.analysis.compute()
+            self.analysis.graph()
+            export_report(self.analysis, self.report_dir)
+        except Exception:
+            logger.exception('Could not make a partial report yet.')
+            return
+        logger.info(f'Partial report of {len(self.df)} videos at {self.report_dir / "index.html"}')
+
+    def consume_metas(self):
+        """Ingest downloaded videos in batches until the producer is done, making partial reports along the way."""
+        batch = []
+        last_report = time.monotonic()
+        with self.analysis.profiler.stage('download') as stage:
+            while True:
+                try:
+                    meta = self.metas.get(timeout=1)
+                except queue.Empty:
+                    pass
+                else:
+                    if meta is DONE:
+                        break
+                    batch.append(meta)
+                if len(batch) >= self.batch_size:
+                    self.ingest(batch)
+                    batch = []
+                if time.monotonic() - last_report >= self.refresh:
+                    self.partial_report()
+                    last_report = time.monotonic()
+            self.ingest(batch)
+            stage.items = self.counts['done']
+
+    def run(self):
+        """Stream the whole Takeout, then save the urls, events and dataframe like a regular download would.
+
+        Returns
+        -------
+        counts : {str: int}
+            Number of videos 'done', 'failed' or still 'pending'
+        """
+        analysis = self.analysis
+        if self.manifest.done:
+            logger.info(f'Ingesting {len(self.manifest.done)} videos downloaded by earlier runs.')
+            self.ingest(list(analysis.iter_metas(set(self.manifest.done), self.manifest)))
+        producer = threading.Thread(target=self.produce, daemon=True)
+        producer.start()
+        try:
+            self.consume_metas()
+        except BaseException:
+            self.stopped = True
+            raise
+        finally:
+            producer.join()
+            self.downloader.checkpoint()
+            if self.downloader.store is not None:
+                self.downloader.store.close()
+        if self.error is not None:
+            raise self.error
+
+        (analysis.path / 'urls.txt').write_text('\n'.join(self.urls))
+        self.events.to_parquet(analysis.ran / 'events.parquet')
+        self.combine()
+        if self.df is not None:
+            self.publish()
+            analysis.cache.save(analysis.df, analysis.tags)
+        logger.info(f"Downloaded {self.counts['done']} videos, {self.counts['failed']} unavailable, "
+                    f"{self.counts['pending']} left for the next run.")
+        return self.counts
@@ -0,0 +1,141 @@
+"""
+Per-stage instrumentation of an analysis: wall and CPU time, peak memory and throughput.
+"""
+
+import cProfile
+import json
+import resource
+import time
+
+from contextlib import contextmanager
+
+from loguru import logger
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB.
+
+    On Linux, `ru_maxrss` survives exec, so a spawned child reports its parent's peak.
+    `VmHWM` belongs to the current address space, so it's preferred where available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    """Current resident memory of this process in MB, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak():
+    """Reset the peak RSS to the current RSS, so the next stage's peak is its own.
+
+    Only Linux allows this. Elsewhere, peaks are for the whole process so far.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class Stage:
+    """Measurements of one stage. `items` can be set inside the stage, once it's known."""
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+        self.seconds = None
+        self.cpu_seconds = None
+        self.peak_mb = None
+        self.peak_delta_mb = None
+
+    @property
+    def per_second(self):
+        """Items processed per second of wall time."""
+        if not self.items or not self.seconds:
+            return None
+        return self.items / self.seconds
+
+    def to_dict(self):
+        return {'stage': self.name, 'seconds': self.seconds, 'cpu_seconds': self.cpu_seconds,
+                'peak_mb': self.peak_mb, 'peak_delta_mb': self.peak_delta_mb,
+                'items': self.items, 'per_second': self.per_second}
+
+
+class Profiler:
+    """Records every stage of an analysis, optionally under cProfile.
+
+    CPU time and memory are for this process only, so work done in worker processes
+    (e.g. reading json files in `df_from_files`) shows up as wall time. A stage started inside
+    another one is recorded too, but doesn't reset the peak memory or start a second cProfile.
+
+    Parameters
+    ----------
+    profile_dir : Optional[Path]
+        If given, each stage's cProfile stats are dumped to `<profile_dir>/<stage>.pstats`,
+        and every stage so far is summarized in `<profile_dir>/summary.json`.
+
+    Attributes
+    ----------
+    stages : [Stage]
+        Every finished stage, in the order they finished
+    """
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.depth = 0
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """Measure the code in the `with` block, yielding its Stage so `items` can be filled in."""
+        record = Stage(name, items)
+        outermost = self.depth == 0
+        if outermost:
+            reset_peak()
+        profile = cProfile.Profile() if outermost and self.profile_dir is not None else None
+        start_mb = rss_mb()
+        start, start_cpu = time.perf_counter(), time.process_time()
+        self.depth += 1
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.depth -= 1
+            record.seconds = time.perf_counter() - start
+            record.cpu_seconds = time.process_time() - start_cpu
+            record.peak_mb = peak_rss_mb()
+            record.peak_delta_mb = None if start_mb is None else record.peak_mb - start_mb
+            self.stages.append(record)
+            self.save(record, profile)
+            items = '' if record.items is None else f', {record.items} items'
+            logger.info(f'{name} took {record.seconds:.2f}s ({record.cpu_seconds:.2f}s CPU), '
+                        f'peak memory {record.peak_mb:.0f} MB{items}')
+
+    def save(self, record, profile):
+        if self.profile_dir is None:
+            return
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if profile is not None:
+            profile.dump_stats(self.profile_dir / f'{record.name}.pstats')
+        summary = json.dumps(self.summary(), indent=2)
+        (self.profile_dir / 'summary.json').write_text(summary)
+
+    def summary(self):
+        """Every stage's measurements, as json-serializable dicts."""
+        return [stage.to_dict() for stage in self.stages]
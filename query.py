@@ -0,0 +1,282 @@
+"""
+In-memory columnar index of the analyzed videos, behind the JSON query API.
+
+Filters are answered from posting lists (the rows with each uploader, language, tag, decile...)
+and a sorted index of upload dates, so a query touches the matching rows rather than scanning every column.
+Only the requested page of rows is ever converted to Python, and the JSON of each distinct query is cached.
+"""
+
+import json
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# Columns sent for each video, in this order
+ROW_COLUMNS = ('id', 'title', 'uploader', 'language', 'upload_date', 'view_count', 'like_count',
+               'comment_count', 'duration', 'likes_pct', 'deciles')
+SORTABLE = ('position', 'title', 'upload_date', 'view_count', 'like_count', 'comment_count', 'duration',
+            'likes_pct')
+GROUPS = ('uploader', 'language', 'tag', 'year', 'month', 'decile')
+GROUP_SORTS = ('videos', 'views', 'duration', 'key')
+PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+
+class Postings:
+    """The rows holding each integer code, e.g. the videos of each uploader. Code -1 means missing."""
+    def __init__(self, codes):
+        self.order = np.argsort(codes, kind='stable')
+        self.bounds = np.r_[0, np.cumsum(np.bincount(codes + 1))]
+
+    def rows(self, code):
+        if not 0 <= code < len(self.bounds) - 2:
+            return np.array([], dtype=np.int64)
+        return self.order[self.bounds[code + 1]:self.bounds[code + 2]]
+
+
+class Categories:
+    """A categorical column as codes and labels, with postings built on first use."""
+    def __init__(self, values):
+        categorical = pd.Categorical(values)
+        self.codes = categorical.codes.astype(np.int64)
+        self.labels = categorical.categories
+        self._postings = None
+
+    def rows(self, label):
+        if label not in self.labels:
+            return np.array([], dtype=np.int64)
+        if self._postings is None:
+            self._postings = Postings(self.codes)
+        return self._postings.rows(self.labels.get_loc(label))
+
+
+class VideoIndex:
+    """Answers filtered, sorted and paginated queries, and aggregations, over every video.
+
+    Parameters
+    ----------
+    frame : DataFrame
+        `Analysis.frame`, in history order
+    tags : TagStore
+        The tags of each video in frame
+    cache_size : int (default=1024)
+        Number of distinct queries whose responses are kept
+
+    Filters are query parameters, and each may be repeated to match any of several values:
+    `uploader`, `language`, `tag`, `decile` (0-9), and `since`/`until` (inclusive upload dates, YYYY-MM-DD).
+    """
+    def __init__(self, frame, tags, cache_size=1024):
+        self.n = len(frame)
+        self.tags = tags
+        self.table = pa.table({col: pa.array(frame[col], from_pandas=True) for col in ROW_COLUMNS if col in frame})
+        if 'upload_date' in self.table.column_names:
+            dates = self.table['upload_date'].cast(pa.date32())
+            self.table = self.table.set_column(self.table.column_names.index('upload_date'), 'upload_date', dates)
+        self.uploader = Categories(frame['uploader'])
+        self.language = Categories(frame['language'])
+        self.deciles = frame['deciles'].to_numpy(np.int64, na_value=-1)
+        self.views = frame['view_count'].to_numpy(np.float64, na_value=np.nan)
+        self.duration = frame['duration'].to_numpy(np.float64, na_value=np.nan)
+        self.likes_pct = frame['likes_pct'].to_numpy(np.float64, na_value=np.nan)
+
+        dates = frame['upload_date'].to_numpy('datetime64[D]')
+        missing = np.isnat(dates)
+        self.days = np.where(missing, np.iinfo(np.int64).min, dates.astype(np.int64))
+        self.date_order = np.argsort(self.days, kind='stable')
+        self.sorted_days = self.days[self.date_order]
+        self.first_dated = int(missing.sum())
+        self.months = np.where(missing, -1, dates.astype('datetime64[M]').astype(np.int64))
+        self.years = np.where(missing, -1, dates.astype('datetime64[Y]').astype(np.int64))
+        self._decile_postings = None
+        self._orders = {}
+        self.query = lru_cache(cache_size)(self._query)
+
+    def uploaded_between(self, since=None, until=None):
+        """Rows uploaded on or between two dates, found by binary search of the sorted dates."""
+        lo = self.first_dated
+        hi = len(self.sorted_days)
+        if since is not None:
+            lo = max(lo, np.searchsorted(self.sorted_days, since, side='left'))
+        if until is not None:
+            hi = np.searchsorted(self.sorted_days, until, side='right')
+        return self.date_order[lo:hi]
+
+    def decile_rows(self, decile):
+        if self._decile_postings is None:
+            self._decile_postings = Postings(self.deciles)
+        return self._decile_postings.rows(decile)
+
+    def select(self, uploader=(), language=(), tag=(), decile=(), since=None, until=None):
+        """A boolean mask of the rows matching every given filter, or None if there are no filters."""
+        mask = None
+        lookups = [(self.uploader.rows, uploader), (self.language.rows, language),
+                   (self.tags.rows_with, tag), (self.decile_rows, decile)]
+        selections = [[find(value) for value in values] for find, values in lookups if values]
+        if since is not None or until is not None:
+            selections.append([self.uploaded_between(since, until)])
+        for rows in selections:
+            matched = np.zeros(self.n, dtype=bool)
+            for r in rows:
+                matched[r] = True
+            mask = matched if mask is None else mask & matched
+        return mask
+
+    def order(self, column, descending=False):
+        """Row positions sorted by a column, missing values last. Each order is computed once."""
+        key = (column, descending)
+        if key not in self._orders:
+            if column == 'position':
+                order = np.arange(self.n)
+                order = order[::-1] if descending else order
+            else:
+                direction = 'descending' if descending else 'ascending'
+                order = pc.sort_indices(self.table, sort_keys=[(column, direction)]).to_numpy()
+            self._orders[key] = order
+        return self._orders[key]
+
+    def rows(self, positions):
+        """The ROW_COLUMNS of some rows as a list of dicts, with missing values as None."""
+        page = self.table.take(pa.array(positions, pa.int64())).to_pylist()
+        for row in page:
+            if row.get('upload_date') is not None:
+                row['upload_date'] = row['upload_date'].isoformat()
+        return page
+
+    def videos(self, filters, sort='position', descending=False, page=1, per_page=PER_PAGE):
+        """One page of the videos matching `filters`, sorted by a column.
+
+        Returns
+        -------
+        response : dict
+            'total' matching videos, the 'page' and 'per_page', and the page's 'videos'
+        """
+        order = self.order(sort, descending)
+        mask = self.select(**filters)
+        selected = order if mask is None else order[mask[order]]
+        start = (page - 1) * per_page
+        return {'total': int(len(selected)), 'page': page, 'per_page': per_page,
+                'videos': self.rows(selected[start:start + per_page])}
+
+    def group_codes(self, by):
+        """Each row's group code and the label of each code, for every `by` but tags."""
+        if by in ('uploader', 'language'):
+            categories = getattr(self, by)
+            return categories.codes, [str(label) for label in categories.labels]
+        if by == 'decile':
+            return self.deciles, list(range(10))
+        if by == 'year':
+            return self.years, [str(1970 + y) for y in range(max(self.years.max() + 1, 0))]
+        months = pd.period_range('1970-01', periods=max(self.months.max() + 1, 0), freq='M')
+        return self.months, [str(m) for m in months]
+
+    def groups(self, by, filters, sort='videos', descending=True, page=1, per_page=PER_PAGE):
+        """Count, total views and duration, and mean views and likes_pct of the matching videos in each group.
+
+        With `by='tag'` a video counts toward each of its tags. Videos without a value for `by` are left out.
+
+        Returns
+        -------
+        response : dict
+            'total' groups, the 'page' and 'per_page', and the page's 'groups'
+        """
+        mask = self.select(**filters)
+        if by == 'tag':
+            codes, rows, labels = self.tags.codes, self.tags.rows, self.tags.vocab
+            keep = np.ones(len(codes), dtype=bool) if mask is None else mask[rows]
+        else:
+            codes, labels = self.group_codes(by)
+            rows = np.arange(self.n)
+            keep = codes >= 0 if mask is None else (codes >= 0) & mask
+        codes, rows = codes[keep], rows[keep]
+        size = len(labels)
+
+        def total(values):
+            valid = ~np.isnan(values[rows])
+            sums = np.bincount(codes[valid], weights=values[rows][valid], minlength=size)
+            return sums, np.bincount(codes[valid], minlength=size)
+
+        videos = np.bincount(codes, minlength=size)
+        views, with_views = total(self.views)
+        duration, _ = total(self.duration)
+        likes, with_likes = total(self.likes_pct)
+        present = np.flatnonzero(videos)
+        if by in ('uploader', 'language'):
+            present = present[[labels[i] != '' for i in present]]
+        key = {'videos': videos, 'views': views, 'duration': duration}.get(sort)
+        if key is None:
+            ranked = present[::-1] if descending else present
+        else:
+            ranked = present[np.argsort(-key[present] if descending else key[present], kind='stable')]
+        start = (page - 1) * per_page
+        groups = []
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in ranked[start:start + per_page]:
+                groups.append({'key': labels[i] if by != 'decile' else int(labels[i]),
+                               'videos': int(videos[i]),
+                               'views': int(views[i]),
+                               'mean_views': float(views[i] / with_views[i]) if with_views[i] else None,
+                               'duration': int(duration[i]),
+                               'mean_likes_pct': float(likes[i] / with_likes[i]) if with_likes[i] else None})
+        return {'by': by, 'total': int(len(present)), 'page': page, 'per_page': per_page, 'groups': groups}
+
+    def _query(self, endpoint, by, params):
+        """The JSON response to a request, from its endpoint and a sorted tuple of (name, values) pairs."""
+        args = dict(params)
+
+        def one(name, default=None):
+            values = args.get(name, ())
+            return values[-1] if values else default
+
+        filters = {name: args.get(name, ()) for name in ('uploader', 'language', 'tag')}
+        filters['decile'] = [to_int('decile', d, 0, 9) for d in args.get('decile', ())]
+        for name in ('since', 'until'):
+            value = one(name)
+            filters[name] = None if value is None else to_day(name, value)
+        page = to_int('page', one('page', '1'), 1)
+        per_page = to_int('per_page', one('per_page', str(PER_PAGE)), 1, MAX_PER_PAGE)
+        descending = one('order', '') == 'desc'
+        if endpoint == 'videos':
+            sort = one('sort', 'position')
+            if sort not in SORTABLE:
+                raise ValueError(f'sort must be one of {", ".join(SORTABLE)}')
+            response = self.videos(filters, sort, descending, page, per_page)
+        else:
+            if by not in GROUPS:
+                raise ValueError(f'groups are by one of {", ".join(GROUPS)}')
+            sort = one('sort', 'videos')
+            if sort not in GROUP_SORTS:
+                raise ValueError(f'groups sort by one of {", ".join(GROUP_SORTS)}')
+            response = self.groups(by, filters, sort, one('order', 'desc') == 'desc', page, per_page)
+        return json.dumps(response)
+
+    def respond(self, endpoint, args, by=None):
+        """The cached JSON response to 'videos' or 'groups' (`by` something), given the query arguments.
+
+        `args` is a werkzeug MultiDict, like Flask's `request.args`.
+        """
+        params = tuple(sorted((name, tuple(args.getlist(name))) for name in args))
+        return self.query(endpoint, by, params)
+
+
+def to_int(name, value, low=None, high=None):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, not {value!r}') from None
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise ValueError(f'{name} must be between {low} and {high}' if high is not None else
+                         f'{name} must be at least {low}')
+    return number
+
+
+def to_day(name, value):
+    """Days since 1970 of a YYYY-MM-DD date, the unit `VideoIndex` stores upload dates in."""
+    try:
+        return int(np.datetime64(value, 'D').astype(np.int64))
+    except ValueError:
+        raise ValueError(f'{name} must be a date like 2020-01-31, not {value!r}') from None
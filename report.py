@@ -0,0 +1,72 @@
+"""
+Renders the analysis report, either for the Flask server or as a static directory.
+"""
+
+import shutil
+
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from loguru import logger
+
+
+ROOT = Path(__file__).parent
+env = Environment(loader=FileSystemLoader(ROOT / 'templates'), autoescape=select_autoescape())
+
+
+def ensure_plotly_js(static_dir):
+    """Write plotly.js into `static_dir/js/` once, so every chart on the page can share it."""
+    path = Path(static_dir) / 'js' / 'plotly.min.js'
+    if not path.is_file():
+        from plotly.offline import get_plotlyjs
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(get_plotlyjs(), encoding='utf-8')
+    return path
+
+
+def optimize_png(src, dst, colors=256):
+    """Save a copy of a png reduced to a palette, which suits flat-colored images like the wordcloud."""
+    from PIL import Image
+    with Image.open(src) as img:
+        img.convert('RGB').quantize(colors=colors).save(dst, optimize=True)
+
+
+def render_report(analysis, static, wordcloud_url=None):
+    """Render index.html for an analysis.
+
+    Parameters
+    ----------
+    analysis : Analysis
+        A computed and graphed analysis
+    static : func
+        Maps a path inside the static directory (e.g. 'css/styles.css') to the url used in the page
+    wordcloud_url : Optional[str]
+        Where the page loads the wordcloud from. Defaults to its file in the static directory.
+    """
+    if wordcloud_url is None:
+        wordcloud_url = static('images/' + analysis.wordcloud_path.name)
+    with analysis.profiler.stage('render'):
+        return env.get_template('index.html').render(analysis=analysis, static=static, wordcloud_url=wordcloud_url)
+
+
+def export_report(analysis, out_dir):
+    """Render the report once into a directory that can be opened or hosted without a server.
+
+    Returns
+    -------
+    index : Path
+        The exported index.html
+    """
+    out_dir = Path(out_dir)
+    static_dir = out_dir / 'static'
+    (static_dir / 'css').mkdir(parents=True, exist_ok=True)
+    (static_dir / 'images').mkdir(parents=True, exist_ok=True)
+    shutil.copy(ROOT / 'static/css/styles.css', static_dir / 'css')
+    ensure_plotly_js(static_dir)
+    wordcloud_path = analysis.wordcloud_image()
+    if wordcloud_path.is_file():
+        optimize_png(wordcloud_path, static_dir / 'images' / wordcloud_path.name)
+    index = out_dir / 'index.html'
+    index.write_text(render_report(analysis, lambda filename: f'static/{filename}'), encoding='utf-8')
+    logger.info(f'Report exported to {index}')
+    return index
@@ -0,0 +1,116 @@
+"""
+The Flask server of the report and its JSON API.
+
+It serves either an Analysis or, with `--serve-only`, the `SavedReport` of an earlier run,
+in which case nothing heavier than Flask is imported until the API is first queried.
+"""
+
+import json
+
+from pathlib import Path
+from webbrowser import open_new_tab
+
+from flask import Flask
+from flask import Response
+from flask import request
+from flask import send_file
+
+from report import ensure_plotly_js
+
+
+app = Flask(__name__)
+served = None  # The Analysis or SavedReport being served
+rendered = None  # Its page, rendered once when the server starts
+
+
+def static_url(filename):
+    """The url of a file in the static directory, as `url_for('static', filename=filename)` would build it."""
+    return f'/static/{filename}'
+
+
+class SavedReport:
+    """The report rendered by the last run of an analysis, served as is.
+
+    Parameters
+    ----------
+    out_base : str (default='data')
+        The directory the analysis was stored in
+    name : str
+        Subdir of out_base of the analysis
+
+    The page and the wordcloud path are read from `ran/report.html` and `ran/report.json`.
+    The JSON API needs the videos, so the first query loads them from the cache (see `video_index`).
+    """
+    def __init__(self, out_base, name):
+        self.out_base = out_base
+        self.name = name
+        self.ran = Path(out_base) / name / 'ran'
+        self._analysis = None
+
+    def has_data(self):
+        return (self.ran / 'report.html').is_file() and (self.ran / 'report.json').is_file()
+
+    def render(self, static, wordcloud_url):
+        """The saved page. It was rendered with the same urls, so `static` and `wordcloud_url` are unused."""
+        return (self.ran / 'report.html').read_text(encoding='utf-8')
+
+    def wordcloud_image(self):
+        return Path(json.loads((self.ran / 'report.json').read_text())['wordcloud'])
+
+    @property
+    def video_index(self):
+        """The index of the cached videos, loaded along with pandas on the first API query."""
+        if self._analysis is None:
+            from youtube_history import Analysis
+            analysis = Analysis(None, self.out_base, self.name)
+            analysis.check_df()
+            self._analysis = analysis
+        return self._analysis.video_index
+
+
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    return rendered
+
+
+@app.route('/wordcloud.png')
+def wordcloud():
+    """The wordcloud, sent once its background worker has finished drawing it."""
+    return send_file(served.wordcloud_image().resolve())
+
+
+@app.route('/api/videos')
+def api_videos():
+    """A page of videos, filtered and sorted by the query parameters (see `query.VideoIndex`)."""
+    return api_response('videos')
+
+
+@app.route('/api/groups/<by>')
+def api_groups(by):
+    """Video counts, views and durations per uploader, language, tag, year, month or decile."""
+    return api_response('groups', by)
+
+
+def api_response(endpoint, by=None):
+    try:
+        body = served.video_index.respond(endpoint, request.args, by)
+    except ValueError as e:
+        return Response(json.dumps({'error': str(e)}), status=400, mimetype='application/json')
+    return Response(body, mimetype='application/json')
+
+
+def launch_web(report, reload=True):
+    """Serve an Analysis or SavedReport at http://127.0.0.1:5000, opening it in a new browser tab.
+
+    With `reload`, the debug server restarts the whole script when a source file changes.
+    """
+    global served, rendered
+    app.debug = True
+    app.secret_key = "this is not real"
+    ensure_plotly_js(app.static_folder)
+    some_data = report.has_data()
+    if some_data:
+        served, rendered = report, report.render(static_url, '/wordcloud.png')
+        url = 'http://127.0.0.1:5000'
+        open_new_tab(url)
+        app.run(use_reloader=reload)
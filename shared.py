@@ -0,0 +1,75 @@
+"""
+A metadata library shared by several users' analyses, holding each video once.
+"""
+
+import numpy as np
+
+from loguru import logger
+
+from cache import ColumnCache
+from downloader import UNAVAILABLE_TTL, Downloader, Manifest
+from ingest import columns_from_metas, frame_from_columns
+from store import DEFAULT_KEYS, MetadataStore
+from tags import TagStore
+
+
+class SharedLibrary:
+    """Downloads every unique video watched by a group of users once, into one store and cache.
+
+    Each user keeps only their own watch events and `urls.txt`, and selects their rows from the
+    shared cache by video id.
+
+    Parameters
+    ----------
+    path : Path
+        Directory of the library (e.g. `data/shared`)
+    keep_keys : (str)
+        The info.json keys kept in the store
+    unavailable_ttl : Optional[float] (default=30 days)
+        Seconds before videos that couldn't be downloaded are tried again. None never retries them.
+
+    Attributes
+    ----------
+    store : MetadataStore
+        Trimmed metadata of every downloaded video, at `path/metadata.jsonl.gz`
+    manifest : Manifest
+        Download progress, at `path/manifest.json`
+    cache : ColumnCache
+        Dataframe and tags of every video in the store, at `path/videos.parquet`
+    """
+    def __init__(self, path, keep_keys=DEFAULT_KEYS, unavailable_ttl=UNAVAILABLE_TTL):
+        self.path = path
+        self.store = MetadataStore(path / 'metadata.jsonl.gz', keep_keys)
+        self.manifest = Manifest(path / 'manifest.json', unavailable_ttl)
+        self.cache = ColumnCache(path / 'videos.parquet')
+
+    def download(self, urls, extractor=None, workers=8):
+        """Fetch the urls that no user has downloaded before.
+
+        New videos are numbered after the last run's, so the store keeps the order they were added in.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        downloader = Downloader(self.path, self.manifest, extractor, workers=workers, store=self.store)
+        counts = downloader.run(urls, offset=self.manifest.last_number)
+        logger.info(f"Downloaded {counts['done']} videos, {counts['failed']} unavailable, "
+                    f"{counts['pending']} left for the next run.")
+        return counts
+
+    def build_cache(self):
+        """Compile the store into the column cache, if the store changed since it was last built."""
+        if not self.store.exists():
+            return
+        if self.cache.exists() and self.cache.path.stat().st_mtime >= self.store.path.stat().st_mtime:
+            return
+        logger.info('Compiling the shared metadata store...')
+        df, tags = frame_from_columns(columns_from_metas(self.store))
+        self.cache.save(df, TagStore.from_lists(tags))
+
+    def load(self, ids, columns=None):
+        """The dataframe rows and tags of the given video ids, in library order.
+
+        `columns` should include 'id', which is used to select the rows.
+        """
+        df = self.cache.load(columns)
+        rows = np.flatnonzero(df['id'].isin(ids).to_numpy())
+        return df.iloc[rows].reset_index(drop=True), self.cache.load_tags().take(rows)
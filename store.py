@@ -0,0 +1,107 @@
+"""
+A single compressed json-lines file holding trimmed metadata for every downloaded video.
+"""
+
+import gzip
+import json
+import os
+import threading
+import zlib
+
+
+# The keys used by the analysis. Everything else (formats, captions, thumbnails...) is dropped.
+DEFAULT_KEYS = ('id', 'autonumber', 'title', 'webpage_url', 'uploader', 'language', 'upload_date',
+                'duration', 'view_count', 'like_count', 'comment_count', 'height', 'description', 'tags')
+
+
+def project(info, keys=DEFAULT_KEYS):
+    """Keep only the whitelisted keys of an info dict."""
+    return {k: info[k] for k in keys if k in info}
+
+
+def complete_lines(path):
+    """The complete lines of a gzipped file, up to the first damaged gzip member if there is one.
+
+    A process killed after a flush leaves a member without its trailer. Nothing after it can be read.
+
+    Returns
+    -------
+    lines : [str]
+    intact : bool
+        False if the end of the file couldn't be read
+    """
+    lines = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    lines.append(line)
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        return lines, False
+    return lines, True
+
+
+class MetadataStore:
+    """Append-only, gzipped json-lines store of projected info dicts.
+
+    Each call to `append` writes one line. The file is opened in append mode, so an interrupted
+    download can be resumed into the same store. If the last run was killed, the records it flushed
+    are first rewritten into a fresh file (see `repair`), since gzip can't read past a cut off member.
+
+    Parameters
+    ----------
+    path : Path
+        Location of the `.jsonl.gz` file
+    keys : (str)
+        Whitelist of info dict keys to keep
+    """
+    def __init__(self, path, keys=DEFAULT_KEYS):
+        self.path = path
+        self.keys = tuple(keys)
+        self.lock = threading.Lock()
+        self.file = None
+
+    def exists(self):
+        return self.path.is_file()
+
+    def append(self, info):
+        line = json.dumps(project(info, self.keys)) + '\n'
+        with self.lock:
+            if self.file is None:
+                self.repair()
+                self.file = gzip.open(self.path, 'at', encoding='utf-8')
+            self.file.write(line)
+
+    def repair(self):
+        """Rewrite the readable records of a store whose last run didn't close it. Returns whether it had to."""
+        if not self.exists():
+            return False
+        lines, intact = complete_lines(self.path)
+        if intact:
+            return False
+        tmp = self.path.with_suffix('.tmp')
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp, self.path)
+        return True
+
+    def flush(self):
+        """Make everything appended so far readable, even if the process dies afterwards."""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __iter__(self):
+        """Yield each record once, keeping the last copy of any video that was fetched twice,
+        in order of `autonumber` (i.e. position in the watch history)."""
+        records = {}
+        for line in complete_lines(self.path)[0]:
+            record = json.loads(line)
+            records[record.get('id')] = record
+        yield from sorted(records.values(), key=lambda r: r.get('autonumber', 0))
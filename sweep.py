@@ -0,0 +1,319 @@
+"""
+View deciles, the best and worst video of each, and the most common uploaders and languages, in one pass.
+
+`Sweep` reads the videos a chunk at a time (e.g. one user's frame after another) and keeps running totals,
+so each chunk is read once instead of once per metric. Exact results keep every view count until the end,
+to cut the deciles. With `approximate=True` memory stays bounded however many videos are swept:
+view counts go into a `QuantileSketch`, and uploaders and languages into `HeavyHitters`.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+N_DECILES = 10
+MISSING = np.iinfo(np.int64).max
+
+
+def group_extremes(codes, values, size):
+    """The max and min of `values` in each group, and the position of the first row reaching them.
+
+    Codes below 0 and NaN values are skipped. Positions of empty groups are -1.
+
+    Returns
+    -------
+    highs, high_at, lows, low_at : ndarray
+        One entry per group
+    """
+    valid = (codes >= 0) & ~np.isnan(values)
+    positions = np.flatnonzero(valid)
+    codes, values = codes[valid], values[valid]
+    highs = np.full(size, -np.inf)
+    np.maximum.at(highs, codes, values)
+    lows = np.full(size, np.inf)
+    np.minimum.at(lows, codes, values)
+
+    def first(extremes):
+        hit = values == extremes[codes]
+        found = np.full(size, MISSING)
+        np.minimum.at(found, codes[hit], positions[hit])
+        return np.where(found == MISSING, -1, found)
+
+    return highs, first(highs), lows, first(lows)
+
+
+def decile_edges(views):
+    """The edges `pd.qcut(views, 10)` cuts at, minus any duplicates (e.g. when most videos have 0 views)."""
+    return np.unique(np.quantile(views, np.linspace(0, 1, N_DECILES + 1)))
+
+
+def cut(values, edges):
+    """The bin of each value, like `pd.cut(values, edges, labels=False, include_lowest=True)`."""
+    bins = np.searchsorted(edges, values, side='left')
+    bins[values == edges[0]] = 1
+    return np.clip(bins - 1, 0, max(len(edges) - 2, 0))
+
+
+def decile_codes(views):
+    """The view count decile of each video, matching `pd.qcut(views, 10, labels=False)` where that doesn't fail."""
+    views = np.asarray(views, dtype=np.float64)
+    if not len(views):
+        return np.zeros(0, dtype=np.int64)
+    return cut(views, decile_edges(views))
+
+
+class Extremes:
+    """Running max and min of a value in each group, and the position of the first video to reach them.
+
+    Groups are labeled (e.g. by language), so chunks with different categories can be combined.
+    Chunks must arrive in order, so that ties go to the earliest video, as with pandas' idxmax.
+    """
+    def __init__(self):
+        self.table = pd.DataFrame({'high': pd.Series(dtype=float), 'high_at': pd.Series(dtype=np.int64),
+                                   'low': pd.Series(dtype=float), 'low_at': pd.Series(dtype=np.int64)})
+
+    def update(self, codes, labels, values, offset=0):
+        """Add a chunk of `values`, whose groups are `labels[codes]`, and whose first video is at `offset`."""
+        highs, high_at, lows, low_at = group_extremes(codes, values, len(labels))
+        chunk = pd.DataFrame({'high': highs, 'high_at': high_at + offset, 'low': lows, 'low_at': low_at + offset},
+                             index=labels)[high_at >= 0]
+        self.table = self.combine(self.table, chunk)
+
+    @staticmethod
+    def combine(old, new):
+        if old.empty:
+            return new
+        index = old.index.union(new.index)
+        old, new = old.reindex(index), new.reindex(index)
+        higher = new['high_at'].notna() & ~(new['high'] <= old['high'])
+        lower = new['low_at'].notna() & ~(new['low'] >= old['low'])
+        return pd.DataFrame({'high': new['high'].where(higher, old['high']),
+                             'high_at': new['high_at'].where(higher, old['high_at']).astype(np.int64),
+                             'low': new['low'].where(lower, old['low']),
+                             'low_at': new['low_at'].where(lower, old['low_at']).astype(np.int64)}, index=index)
+
+    def regroup(self, groups):
+        """Extremes of coarser groups, given the new group of each current one (e.g. the decile of each bucket)."""
+        table = self.table.assign(group=groups)
+        high = table.sort_values(['high', 'high_at'], ascending=[False, True]).groupby('group').first()
+        low = table.sort_values(['low', 'low_at']).groupby('group').first()
+        return high['high_at'], low['low_at']
+
+    def keep(self, labels):
+        self.table = self.table[self.table.index.isin(labels)]
+
+
+class QuantileSketch:
+    """A log-bucketed histogram of non-negative values, whose quantiles are within `relative_accuracy` (DDSketch).
+
+    Bucket i > 0 holds the values in (gamma^(i-2), gamma^(i-1)], and bucket 0 every value below 1.
+    Views are integers, so that's every 0. A billion views fit in about a thousand buckets at 1% accuracy.
+    Each bucket also keeps the Extremes of a second value, e.g. the best and worst liked video of that size.
+
+    Parameters
+    ----------
+    relative_accuracy : float (default=.01)
+        Each quantile is within this fraction of a value that really is at that rank
+    """
+    def __init__(self, relative_accuracy=.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.extremes = Extremes()
+
+    def buckets(self, values):
+        buckets = np.zeros(len(values), dtype=np.int64)
+        positive = values >= 1
+        buckets[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64) + 1
+        return buckets
+
+    def update(self, values, others, offset=0):
+        """Add a chunk of values, and the `others` whose extremes are kept per bucket."""
+        buckets = self.buckets(values)
+        counts = np.bincount(buckets)
+        if len(counts) > len(self.counts):
+            self.counts = np.r_[self.counts, np.zeros(len(counts) - len(self.counts), dtype=np.int64)]
+        self.counts[:len(counts)] += counts
+        self.extremes.update(buckets, np.arange(len(counts)), others, offset)
+
+    def estimates(self):
+        """The value each bucket stands for: 0, then the midpoint (in relative terms) of its range."""
+        i = np.arange(len(self.counts))
+        return np.where(i == 0, 0, 2 * self.gamma ** (i - 1.) / (self.gamma + 1))
+
+    def quantiles(self, qs):
+        """Approximate `np.quantile(values, qs)`, without interpolating between ranks."""
+        ranks = np.asarray(qs) * (self.counts.sum() - 1)
+        buckets = np.searchsorted(np.cumsum(self.counts), ranks, side='right')
+        return self.estimates()[np.minimum(buckets, len(self.counts) - 1)]
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+
+class HeavyHitters:
+    """Counts of the most common values in a stream, keeping at most `capacity` of them (Misra-Gries).
+
+    Whenever more values are tracked, every count drops by that of the (capacity + 1)th most common one,
+    and those left at 0 are forgotten. Counts are then underestimated by at most `error` <= n / (capacity + 1),
+    so every value seen more often than that is still tracked. With `capacity=None` the counts are exact.
+    """
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.error = 0
+
+    def update(self, counts):
+        """Add a chunk's counts of each value (e.g. its `value_counts()`)."""
+        counts = counts[counts > 0]
+        counts = pd.Series(counts.to_numpy(), index=counts.index.astype(object))
+        counts = self.counts.add(counts, fill_value=0).astype(np.int64)
+        if self.capacity is not None and len(counts) > self.capacity:
+            cut = counts.nlargest(self.capacity + 1).iloc[-1]
+            counts = counts[counts > cut] - cut
+            self.error += int(cut)
+        self.counts = counts
+
+    def most_common(self, n=None):
+        """Values and their counts, most common first. Ties are in value order."""
+        counts = self.counts.sort_index().sort_values(ascending=False, kind='stable')
+        return counts if n is None else counts.head(n)
+
+
+class Sweep:
+    """Summarizes the views, likes, uploaders and languages of videos, a chunk of videos at a time.
+
+    Parameters
+    ----------
+    approximate : bool (default=False)
+        Use bounded memory: sketch the view counts and only track the most common uploaders and languages.
+        Deciles are then cut between sketch buckets, so a video near an edge can land in the next decile.
+    relative_accuracy : float (default=.01)
+        Accuracy of the approximate view quantiles
+    capacity : int (default=1000)
+        Number of uploaders and languages tracked when approximate
+    sample_size : int (default=10)
+        Number of videos with less than 10 views to pick at random
+    seed : int (default=0)
+        Seeds that random pick
+
+    Attributes
+    ----------
+    n : int
+        Number of videos swept so far
+    """
+    def __init__(self, approximate=False, relative_accuracy=.01, capacity=1000, sample_size=10, seed=0):
+        self.approximate = approximate
+        self.sample_size = sample_size
+        self.rng = np.random.RandomState(seed)
+        self.n = 0
+        self.most_viewed = (-np.inf, -1)
+        self.low_views = []  # Arrays of positions
+        self.low_seen = 0
+        self.views = []
+        self.likes = []
+        self.sketch = QuantileSketch(relative_accuracy) if approximate else None
+        self.uploaders = HeavyHitters(capacity if approximate else None)
+        self.languages = HeavyHitters(capacity if approximate else None)
+        self.best_language = Extremes()
+
+    def update(self, df):
+        """Sweep the next chunk of videos. It needs view_count, like_count, uploader and language columns."""
+        offset = self.n
+        views = df['view_count'].to_numpy(np.float64, na_value=np.nan)
+        likes = likes_pct(df['like_count'].to_numpy(np.float64, na_value=np.nan), views)
+
+        if len(views) and not np.isnan(views).all():
+            top = int(np.nanargmax(views))
+            if views[top] > self.most_viewed[0]:
+                self.most_viewed = (views[top], offset + top)
+        self.sample_low_views(np.flatnonzero(views < 10) + offset)
+
+        filled = np.nan_to_num(views, nan=0.)
+        if self.approximate:
+            self.sketch.update(filled, likes, offset)
+        else:
+            self.views.append(filled)
+            self.likes.append(likes)
+
+        self.uploaders.update(df['uploader'].value_counts(sort=False))
+        self.languages.update(df['language'].value_counts(sort=False))
+        languages = pd.Categorical(df['language'])
+        self.best_language.update(languages.codes.astype(np.int64), languages.categories, likes, offset)
+        if self.approximate:
+            self.best_language.keep(self.languages.counts.index)
+        self.n += len(df)
+
+    def sample_low_views(self, positions):
+        """Keep a random sample of the videos with less than 10 views.
+
+        Exact sweeps keep them all, and pick the same sample as `low_views.sample(n, random_state=seed)`.
+        Approximate sweeps keep a reservoir of `sample_size` of them.
+        """
+        if not self.approximate:
+            self.low_views.append(positions)
+            return
+        reservoir = np.concatenate(self.low_views) if self.low_views else np.zeros(0, dtype=np.int64)
+        take = min(self.sample_size - len(reservoir), len(positions))
+        reservoir, rest = np.r_[reservoir, positions[:take]], positions[take:]
+        # Algorithm R: the t-th video replaces a random slot with probability sample_size / t
+        seen = self.low_seen + take + np.arange(1, len(rest) + 1)
+        slots = self.rng.randint(0, seen) if len(rest) else np.zeros(0, dtype=np.int64)
+        replaced = slots < self.sample_size
+        reservoir[slots[replaced]] = rest[replaced]
+        self.low_views = [reservoir]
+        self.low_seen += len(positions)
+
+    def least_viewed(self):
+        low = np.concatenate(self.low_views) if self.low_views else np.zeros(0, dtype=np.int64)
+        if self.approximate:
+            return low
+        return low[self.rng.choice(len(low), min(len(low), self.sample_size), replace=False)]
+
+    def per_decile(self):
+        """Position of the best and worst liked video in each view decile, and the edges of the deciles."""
+        if self.approximate:
+            if not len(self.sketch):
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+            edges = np.unique(self.sketch.quantiles(np.linspace(0, 1, N_DECILES + 1)))
+            deciles = cut(self.sketch.estimates(), edges)
+            high_at, low_at = self.sketch.extremes.regroup(deciles[self.sketch.extremes.table.index])
+            return high_at.to_numpy(), low_at.to_numpy(), edges
+        views = np.concatenate(self.views) if self.views else np.zeros(0)
+        likes = np.concatenate(self.likes) if self.likes else np.zeros(0)
+        if not len(views):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        edges = decile_edges(views)
+        deciles = cut(views, edges)
+        _, high_at, _, low_at = group_extremes(deciles, likes, deciles.max() + 1)
+        return high_at[high_at >= 0], low_at[low_at >= 0], edges
+
+    def result(self):
+        """Everything swept so far.
+
+        Returns
+        -------
+        results : dict
+            'most_viewed' position, 'least_viewed' positions, decile 'edges' and the positions of the
+            'best_per_decile' and 'worst_per_decile' videos, 'uploaders' and 'languages' counts (most common first)
+            and the position of the best liked video of each language in 'best_per_language'
+        """
+        best, worst, edges = self.per_decile()
+        best_language = self.best_language.table['high_at'].sort_index()
+        return {'most_viewed': self.most_viewed[1] if self.most_viewed[1] >= 0 else None,
+                'least_viewed': self.least_viewed(),
+                'edges': edges,
+                'best_per_decile': best,
+                'worst_per_decile': worst,
+                'uploaders': self.uploaders.most_common(),
+                'languages': self.languages.most_common(),
+                'best_per_language': best_language}
+
+
+def likes_pct(likes, views):
+    """`metrics.likes_pct` on arrays."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.round(likes / views * 100, 4)
+    return np.where(np.isnan(pct), 0., pct)
@@ -0,0 +1,218 @@
+"""
+Generates synthetic Takeout data for benchmarking.
+
+To write a Takeout and the info.json files yt-dlp would have downloaded for it, run:
+
+    $ python synthetic.py /tmp/synthetic --entries 100000
+
+and analyze it, without downloading anything, with:
+
+    $ python youtube_history.py --takeout /tmp/synthetic/Takeout --out /tmp/synthetic/data --name synthetic
+"""
+
+import argparse
+import json
+import random
+import string
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from takeout import WATCH_HISTORY
+
+
+HEAD = ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+        '<title>History</title></head><body><div class="mdl-grid">')
+TAIL = '</div></body></html>'
+CELL = ('<div class="outer-cell mdl-cell mdl-cell--12-col mdl-shadow--2dp"><div class="mdl-grid">'
+        '<div class="header-cell mdl-cell mdl-cell--12-col"><p class="mdl-typography--title">YouTube<br></p></div>'
+        '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1">{watched}<br>{when}<br></div>'
+        '<div class="content-cell mdl-cell mdl-cell--6-col mdl-typography--body-1 mdl-typography--text-right"></div>'
+        '<div class="content-cell mdl-cell mdl-cell--12-col mdl-typography--caption">'
+        '<b>Products:</b><br>&emsp;YouTube<br>{details}<b>Why is this here?</b><br>'
+        '&emsp;This activity was saved to your Google Account because the following settings were on:'
+        '&nbsp;YouTube watch history.&nbsp;You can control these settings &nbsp;'
+        '<a href="https://myaccount.google.com/activitycontrols">here</a>.</div></div></div>')
+WATCHED = ('Watched&nbsp;<a href="https://www.youtube.com/watch?v={id}">Video {id}</a><br>'
+           '<a href="https://www.youtube.com/channel/UC{channel}">Channel {channel}</a>')
+REMOVED = 'Watched a video that has been removed'
+AD_DETAILS = '<b>Details:</b><br>&emsp;From Google Ads<br>'
+WORDS = ('video music funny cat dog game minecraft tutorial python review live stream news '
+         'vlog travel food cooking science space history football highlights remix cover '
+         'official trailer reaction podcast interview comedy prank asmr lofi beats').split()
+EMOJIS = '😀😂🔥👍🎉❤️🚀🎮🐱🍕'
+LANGUAGES = ['en'] * 12 + ['es', 'fr', 'de', 'ja', 'pt', '']
+
+
+def random_video_id(rng):
+    return ''.join(rng.choices(string.ascii_letters + string.digits + '-_', k=11))
+
+
+def format_watched_at(when):
+    """Takeout's english timestamp format, which uses a narrow no-break space before AM/PM."""
+    hour = when.hour % 12 or 12
+    meridiem = 'AM' if when.hour < 12 else 'PM'
+    return f'{when:%b} {when.day}, {when.year}, {hour}:{when:%M:%S}\u202f{meridiem} EST'
+
+
+def fake_info(rng, vid, n_channels=1000):
+    """A projected info dict with realistic shapes for every key the analysis uses."""
+    views = int(10 ** rng.uniform(0, 9))
+    description = ' '.join(rng.choices(WORDS, k=rng.randint(0, 300)))
+    description += ''.join(rng.choices(EMOJIS, k=rng.randint(0, 4)))
+    return {'id': vid,
+            'title': ' '.join(rng.choices(WORDS, k=rng.randint(2, 10))),
+            'webpage_url': f'https://www.youtube.com/watch?v={vid}',
+            'uploader': f'Channel {int(rng.paretovariate(1.2)) % n_channels}',
+            'language': rng.choice(LANGUAGES),
+            'upload_date': f'{rng.randint(2006, 2024)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}',
+            'duration': int(10 ** rng.uniform(1, 4)),
+            'view_count': views,
+            'like_count': int(views * rng.uniform(0, .08)),
+            'comment_count': int(views * rng.uniform(0, .005)),
+            'height': rng.choice([360, 480, 720, 1080, 2160]),
+            'description': description,
+            'tags': rng.choices(WORDS, k=rng.randint(0, 25))}
+
+
+def bulk_info(rng, vid):
+    """The keys the analysis never reads (formats, captions, thumbnails...), at roughly their real size."""
+    base = f'https://rr{rng.randint(1, 9)}---sn-abcdef.googlevideo.com/videoplayback?id={vid}&itag='
+    formats = [{'format_id': str(itag), 'url': base + str(itag) + '&sig=' + 'x' * 120,
+                'ext': rng.choice(['mp4', 'webm', 'm4a']), 'width': 16 * h // 9, 'height': h,
+                'fps': 30, 'vcodec': 'avc1.4d401f', 'acodec': 'none', 'filesize': rng.randint(10**5, 10**9),
+                'http_headers': {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-us,en;q=0.5'}}
+               for itag, h in zip(range(133, 153), [144, 240, 360, 480, 720, 1080] * 4)]
+    captions = {lang: [{'ext': ext, 'url': f'https://www.youtube.com/api/timedtext?v={vid}&lang={lang}&fmt={ext}'}
+                       for ext in ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt')]
+                for lang in ('en', 'es', 'fr', 'de', 'ja', 'pt', 'ru', 'ko')}
+    thumbnails = [{'url': f'https://i.ytimg.com/vi/{vid}/{name}.jpg', 'preference': -i, 'id': str(i)}
+                  for i, name in enumerate(['default', 'mqdefault', 'hqdefault', 'sddefault', 'maxresdefault'])]
+    return {'formats': formats, 'automatic_captions': captions, 'thumbnails': thumbnails,
+            'channel_url': f'https://www.youtube.com/channel/UC{vid}', 'categories': ['Entertainment'],
+            'availability': 'public', 'live_status': 'not_live', 'extractor': 'youtube', '_type': 'video'}
+
+
+def write_watch_history(takeout, n_entries, n_videos=None, ad_rate=.02, removed_rate=.03, seed=0, urls=None):
+    """Write a `watch-history.html` with the same structure as a real Takeout export.
+
+    Parameters
+    ----------
+    takeout : str
+        Directory that will act as the unzipped Takeout folder
+    n_entries : int
+        Total number of watch events (cells) in the file
+    n_videos : Optional[int]
+        Number of distinct videos to draw watches from. Defaults to 80% of n_entries.
+    ad_rate : float (default=.02)
+        Fraction of entries that are Google Ads
+    removed_rate : float (default=.03)
+        Fraction of entries for videos that have been removed
+    seed : int (default=0)
+        Seed for the random number generator
+    urls : Optional[list]
+        If given, the urls of the watched videos are appended to it, deduplicated and ads excluded,
+        in the same order as `takeout.parse_watch_history` returns them
+
+    Returns
+    -------
+    path : Path
+        The path of the written file
+    """
+    rng = random.Random(seed)
+    if n_videos is None:
+        n_videos = max(1, int(n_entries * .8))
+    ids = [random_video_id(rng) for _ in range(n_videos)]
+    path = Path(takeout).expanduser() / WATCH_HISTORY
+    path.parent.mkdir(parents=True, exist_ok=True)
+    when = datetime(2024, 6, 1, 12)
+    seen = {}
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write(HEAD)
+        for _ in range(n_entries):
+            when -= timedelta(seconds=rng.randint(30, 4 * 3600))
+            roll = rng.random()
+            details = ''
+            if roll < removed_rate:
+                watched = REMOVED
+            else:
+                vid = rng.choice(ids)
+                watched = WATCHED.format(id=vid, channel=rng.randrange(n_videos // 10 + 1))
+                if roll < removed_rate + ad_rate:
+                    details = AD_DETAILS
+                else:
+                    seen.setdefault(vid, None)
+            out.write(CELL.format(watched=watched, when=format_watched_at(when), details=details))
+        out.write(TAIL)
+    if urls is not None:
+        urls.extend(f'https://www.youtube.com/watch?v={vid}' for vid in seen)
+    return path
+
+
+def write_info_jsons(raw, urls, unavailable_rate=.05, full=False, seed=0):
+    """Write the `<autonumber>.info.json` files that yt-dlp would download for a list of urls.
+
+    Parameters
+    ----------
+    raw : str
+        Directory to write the files to, like an analysis' `raw` directory
+    urls : [str]
+        Watch urls, numbered from 1 in this order
+    unavailable_rate : float (default=.05)
+        Fraction of videos that are deleted or private, and so have no file
+    full : bool (default=False)
+        Also write the keys the analysis doesn't use, making each file about as large as a real one
+    seed : int (default=0)
+        Seed for the random number generator
+
+    Returns
+    -------
+    n_written : int
+        The number of files written
+    """
+    rng = random.Random(seed)
+    raw = Path(raw)
+    raw.mkdir(parents=True, exist_ok=True)
+    n_written = 0
+    for number, url in enumerate(urls, 1):
+        if rng.random() < unavailable_rate:
+            continue
+        vid = url.rsplit('=', 1)[-1]
+        info = fake_info(rng, vid)
+        if full:
+            info.update(bulk_info(rng, vid))
+        with open(raw / f'{number:05d}.info.json', 'w') as f:
+            json.dump(info, f)
+        n_written += 1
+    return n_written
+
+
+def write_takeout(base, n_entries, name='synthetic', full=False, seed=0):
+    """Write a Takeout under `base/Takeout`, and its downloaded info.json files under `base/data/<name>`.
+
+    Returns
+    -------
+    analysis_dir : Path
+        The results directory, holding `urls.txt` and `raw/`, so the analysis skips downloading
+    """
+    base = Path(base)
+    urls = []
+    write_watch_history(base / 'Takeout', n_entries, seed=seed, urls=urls)
+    analysis_dir = base / 'data' / name
+    write_info_jsons(analysis_dir / 'raw', urls, full=full, seed=seed)
+    (analysis_dir / 'urls.txt').write_text('\n'.join(urls))
+    return analysis_dir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base', help='Directory to write the Takeout and data directories to.')
+    parser.add_argument('-e', '--entries', type=int, default=10_000,
+                        help='Number of watch events in the history.')
+    parser.add_argument('-n', '--name', default='synthetic',
+                        help='Name of the analysis directory.')
+    parser.add_argument('--full', action='store_true',
+                        help='Write complete info.json files, not just the keys the analysis reads.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(write_takeout(args.base, args.entries, args.name, args.full, args.seed))
@@ -0,0 +1,118 @@
+"""
+Dictionary-encoded storage of every video's tags, with an inverted index from tag to videos.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class TagStore:
+    """The tags of each video, stored as integer codes into a vocabulary of unique tags.
+
+    The tags of video i are `vocab[codes[offsets[i]:offsets[i + 1]]]`, so each distinct tag
+    is a single Python string no matter how many videos use it.
+
+    Parameters
+    ----------
+    vocab : ndarray
+        Each distinct tag, once
+    codes : ndarray
+        int32 positions in vocab of every tag of every video, in video order
+    offsets : ndarray
+        int64 start of each video's tags in codes, plus the total length at the end
+    valid : ndarray
+        False for videos whose tags were missing (None) rather than empty
+
+    Attributes
+    ----------
+    index : Index
+        Hash table from tag to its code
+    """
+    def __init__(self, vocab, codes, offsets, valid):
+        self.vocab = vocab
+        self.codes = codes
+        self.offsets = offsets
+        self.valid = valid
+        self.index = pd.Index(vocab)
+        self._rows = None
+        self._postings = None
+
+    @classmethod
+    def from_arrow(cls, tags):
+        """Encode a list<string> Arrow array without converting its values to Python."""
+        if isinstance(tags, pa.ChunkedArray):
+            tags = tags.combine_chunks() if tags.num_chunks else pa.array([], pa.list_(pa.string()))
+        offsets = np.asarray(tags.offsets, dtype=np.int64)
+        encoded = pc.dictionary_encode(tags.flatten())
+        codes = np.asarray(encoded.indices, dtype=np.int32)
+        vocab = np.asarray(encoded.dictionary.to_pylist(), dtype=object)
+        valid = ~np.asarray(tags.is_null(), dtype=bool)
+        return cls(vocab, codes, offsets - offsets[0], valid)
+
+    @classmethod
+    def from_lists(cls, tags):
+        """Encode a list of lists of tags (None for videos without tags)."""
+        return cls.from_arrow(pa.array(tags, type=pa.list_(pa.string())))
+
+    @classmethod
+    def concat(cls, stores):
+        return cls.from_arrow(pa.concat_arrays([s.to_arrow() for s in stores]))
+
+    def to_arrow(self):
+        values = pa.array(self.vocab, type=pa.string()).take(pa.array(self.codes))
+        return pa.ListArray.from_arrays(pa.array(self.offsets, pa.int32()), values,
+                                        mask=pa.array(~self.valid))
+
+    def to_lists(self):
+        return self.to_arrow().to_pylist()
+
+    def take(self, rows):
+        """A new TagStore with only the given videos, in the given order."""
+        return self.from_arrow(self.to_arrow().take(pa.array(rows)))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not self.valid[i]:
+            return None
+        return list(self.vocab[self.codes[self.offsets[i]:self.offsets[i + 1]]])
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def rows(self):
+        """The video (row) of every entry in codes."""
+        if self._rows is None:
+            self._rows = np.repeat(np.arange(len(self)), self.lengths)
+        return self._rows
+
+    def flat(self):
+        """Every tag of every video, in order, as references into the vocabulary."""
+        return self.vocab[self.codes]
+
+    def counts(self):
+        """Number of times each vocab entry is used."""
+        return np.bincount(self.codes, minlength=len(self.vocab))
+
+    def frequencies(self, n=None):
+        """Series of tag counts, most common first."""
+        counts = pd.Series(self.counts(), index=self.vocab)
+        counts = counts.sort_values(ascending=False, kind='stable')
+        return counts if n is None else counts.head(n)
+
+    def rows_with(self, tag):
+        """Positions of the videos tagged with `tag`, using an inverted index built on first use."""
+        if tag not in self.index:
+            return np.array([], dtype=np.int64)
+        if self._postings is None:
+            order = np.argsort(self.codes, kind='stable')
+            starts = np.r_[0, np.cumsum(self.counts())]
+            self._postings = (self.rows[order], starts)
+        rows, starts = self._postings
+        code = self.index.get_loc(tag)
+        return np.unique(rows[starts[code]:starts[code + 1]])
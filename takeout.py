@@ -0,0 +1,178 @@
+"""
+Streaming extraction of watch events from a Takeout `watch-history.html`.
+
+lxml, numpy and pandas are imported by the functions that use them, so `video_id` stays cheap to import.
+"""
+
+from array import array
+from collections import namedtuple
+from urllib.parse import parse_qs, urlparse
+
+
+WatchRecord = namedtuple('WatchRecord', ['video_url', 'watched_at', 'is_ad'])
+
+WATCH_HISTORY = 'YouTube and YouTube Music/history/watch-history.html'
+WATCHED_AT_FORMAT = '%b %d, %Y, %I:%M:%S %p'
+
+
+def video_id(url):
+    """The `v` parameter of a watch url, or the url itself if it doesn't have one."""
+    ids = parse_qs(urlparse(url).query).get('v')
+    return ids[0] if ids else url
+
+
+def video_ids(urls):
+    """Vectorized `video_id` over a Series of urls."""
+    return urls.str.extract(r'[?&]v=([^&#]+)', expand=False).fillna(urls)
+
+
+def _is_outer_cell(elem):
+    """Outer cells are the direct children of the grid that is the first child of <body>."""
+    grid = elem.getparent()
+    if grid is None:
+        return False
+    body = grid.getparent()
+    return body is not None and body.tag == 'body' and body[0] is grid
+
+
+def _last_text(cell):
+    """The timestamp is the last bare text node of the cell holding the video url."""
+    for child in reversed(cell):
+        if child.tail and child.tail.strip():
+            return child.tail.strip()
+    return cell.text.strip() if cell.text and cell.text.strip() else None
+
+
+def _record_from_cell(outer_cell):
+    inner_children = list(outer_cell[0])
+    div_with_vid_url = inner_children[1]
+    div_with_ads_info = inner_children[3]
+    is_ad = 'From Google Ads' in ''.join(div_with_ads_info.itertext())
+    link = next(div_with_vid_url.iter('a'), None)
+    video_url = None if link is None else link.get('href')
+    return WatchRecord(video_url, _last_text(div_with_vid_url), is_ad)
+
+
+def iter_watch_history(path):
+    """Yield a WatchRecord for every outer cell of a watch history file.
+
+    The file is parsed incrementally, and each cell is discarded as soon as it has been read,
+    so memory use doesn't grow with the size of the history.
+
+    Parameters
+    ----------
+    path : Path
+        Path to `watch-history.html`
+
+    Yields
+    ------
+    record : WatchRecord
+        `video_url` is None for removed videos, `watched_at` is the raw timestamp text.
+    """
+    from lxml import etree
+    context = etree.iterparse(str(path), events=('end',), tag='div',
+                              html=True, encoding='utf-8', huge_tree=True)
+    for _, elem in context:
+        if not _is_outer_cell(elem):
+            continue
+        yield _record_from_cell(elem)
+        grid = elem.getparent()
+        elem.clear()
+        while grid[0] is not elem:
+            del grid[0]
+    del context
+
+
+def parse_watch_history(path):
+    """Extract ad counts and deduplicated video urls, matching `Analysis.parse_soup`.
+
+    Parameters
+    ----------
+    path : Path
+        Path to `watch-history.html`
+
+    Returns
+    -------
+    deduped_vids : [str]
+        Video urls in order of their most recent watch, ads excluded
+    ad_count : int
+        Number of watches that were Google Ads
+    """
+    ad_count = 0
+    videos = {}
+    for record in iter_watch_history(path):
+        if record.is_ad:
+            ad_count += 1
+        elif record.video_url is not None:
+            videos.setdefault(record.video_url, None)
+    return list(videos), ad_count
+
+
+def parse_watched_at(raw):
+    """Vectorized parsing of Takeout timestamps like 'Jun 1, 2024, 8:53:58 AM EST'.
+
+    The time zone abbreviation is dropped, leaving the local time the video was watched.
+    Timestamps in other formats (e.g. non-English exports) become NaT.
+    """
+    import pandas as pd
+    raw = pd.Series(raw, dtype=object).str.replace('\u202f', ' ', regex=False)
+    raw = raw.str.replace(r'(?<=[AP]M)\s+\S+$', '', regex=True)
+    return pd.to_datetime(raw, format=WATCHED_AT_FORMAT, errors='coerce').to_numpy()
+
+
+def read_watch_events(path, chunk_size=100_000, on_url=None):
+    """Build a table of every watch event in the history, in file order (most recent first).
+
+    Urls are dictionary encoded as they stream past, and timestamps are parsed a chunk at a time,
+    so memory stays proportional to the number of distinct videos plus a few bytes per event.
+
+    Parameters
+    ----------
+    path : Path
+        Path to `watch-history.html`
+    chunk_size : int (default=100_000)
+        Number of timestamps parsed at a time
+    on_url : Optional[func]
+        Called with each url as soon as it's read, the first time it's watched (not as an ad).
+        The urls arrive in the same order as `urls_from_events` returns them.
+
+    Returns
+    -------
+    events : DataFrame
+        video_url : category, NaN for removed videos
+        watched_at : datetime64, NaT if the timestamp couldn't be parsed
+        is_ad : bool
+    """
+    import numpy as np
+    import pandas as pd
+    url_codes = {}
+    codes = array('i')
+    is_ad = array('b')
+    watched_at = []
+    pending = []
+    watched = set()
+    for record in iter_watch_history(path):
+        url = record.video_url
+        codes.append(-1 if url is None else url_codes.setdefault(url, len(url_codes)))
+        if on_url is not None and url is not None and not record.is_ad and url not in watched:
+            watched.add(url)
+            on_url(url)
+        is_ad.append(record.is_ad)
+        pending.append(record.watched_at)
+        if len(pending) == chunk_size:
+            watched_at.append(parse_watched_at(pending))
+            pending = []
+    watched_at.append(parse_watched_at(pending))
+    return pd.DataFrame({
+        'video_url': pd.Categorical.from_codes(np.frombuffer(codes, dtype=np.int32) if codes else [],
+                                               categories=list(url_codes)),
+        'watched_at': np.concatenate(watched_at).astype('datetime64[s]'),
+        'is_ad': np.frombuffer(is_ad, dtype=np.int8).astype(bool) if is_ad else np.array([], dtype=bool),
+    })
+
+
+def urls_from_events(events):
+    """Deduplicated non-ad video urls and the ad count, matching `parse_watch_history`."""
+    import pandas as pd
+    watched = events.loc[~events['is_ad'], 'video_url'].dropna()
+    return list(pd.unique(watched.astype(object))), int(events['is_ad'].sum())
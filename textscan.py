@@ -0,0 +1,113 @@
+"""
+Vectorized scans of video descriptions for emojis and keywords.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from emoji import EMOJI_DATA
+
+
+def _char_class(chars):
+    """A regex character class matching `chars`, collapsed into ranges.
+
+    The same syntax works for Python's re and for RE2, which Arrow uses.
+    """
+    codes = sorted(ord(c) for c in chars)
+    ranges = []
+    for code in codes:
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    parts = [re.escape(chr(a)) if a == b else f'{re.escape(chr(a))}-{re.escape(chr(b))}' for a, b in ranges]
+    return '[' + ''.join(parts) + ']'
+
+
+MAX_EMOJI_LEN = max(map(len, EMOJI_DATA))
+# Every emoji has at least one of these non-ASCII characters. Descriptions without any are skipped.
+EMOJI_CHARS = _char_class({c for e in EMOJI_DATA for c in e if ord(c) > 127})
+# Every emoji contains a non-ASCII character, and only keycaps (e.g. '#️⃣') start with an ASCII one.
+# Searching for non-ASCII characters is far faster than searching for a class of every emoji start,
+# so keycaps are found by stepping back one character from their non-ASCII part.
+NON_ASCII_RE = re.compile('[^\x00-\x7f]')
+KEYCAP_BASES = {e[0] for e in EMOJI_DATA if ord(e[0]) < 128}
+
+
+def _longest_emoji(desc, start):
+    for end in range(min(start + MAX_EMOJI_LEN, len(desc)), start, -1):
+        if desc[start:end] in EMOJI_DATA:
+            return end
+    return None
+
+
+def find_emojis(desc):
+    """The set of emojis in a string, matching the longest emoji at each position like emoji.emoji_list."""
+    found = set()
+    pos = 0
+    while True:
+        match = NON_ASCII_RE.search(desc, pos)
+        if match is None:
+            return found
+        start = match.start()
+        end = None
+        if start > pos and desc[start - 1] in KEYCAP_BASES:
+            end = _longest_emoji(desc, start - 1)
+            if end is not None:
+                start -= 1
+        if end is None:
+            end = _longest_emoji(desc, start)
+        if end is None:
+            pos = start + 1
+        else:
+            found.add(desc[start:end])
+            pos = end
+
+
+def emoji_variety(descriptions):
+    """Number of distinct emojis in each description."""
+    variety = np.zeros(len(descriptions), dtype=np.int64)
+    candidates = pc.fill_null(pc.match_substring_regex(descriptions, EMOJI_CHARS), False)
+    rows = np.flatnonzero(np.asarray(candidates))
+    for row, desc in zip(rows, descriptions.take(pa.array(rows)).to_pylist()):
+        variety[row] = len(find_emojis(desc))
+    return variety
+
+
+def keyword_counts(descriptions, keyword):
+    """Case-insensitive, non-overlapping count of `keyword` in each description."""
+    counts = pc.count_substring(descriptions, keyword, ignore_case=True)
+    return np.asarray(pc.fill_null(counts, 0), dtype=np.int64)
+
+
+def scan_descriptions(descriptions, keywords=('funny',)):
+    """Counts emoji variety and keywords for every description, on one Arrow copy of the column.
+
+    Parameters
+    ----------
+    descriptions : Series
+        Video descriptions. Missing or non-string values count as empty.
+    keywords : (str)
+        Words to count in each description
+
+    Returns
+    -------
+    emojis : Series
+        The number of distinct emojis in each description
+    counts : DataFrame
+        One column per keyword, so any word (even 'emojis') can be counted
+
+    Both have the same index as descriptions.
+    """
+    try:
+        arr = pa.array(descriptions, type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        values = [d if isinstance(d, str) else None for d in descriptions.to_numpy(dtype=object)]
+        arr = pa.array(values, type=pa.large_string())
+    emojis = pd.Series(emoji_variety(arr), index=descriptions.index)
+    counts = pd.DataFrame({keyword: keyword_counts(arr, keyword) for keyword in keywords}, index=descriptions.index)
+    return emojis, counts
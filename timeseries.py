@@ -0,0 +1,69 @@
+"""
+Vectorized time series analysis of watch events.
+
+Every function takes the event table from `takeout.read_watch_events`.
+"""
+
+import numpy as np
+import pandas as pd
+
+from takeout import video_ids
+
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def watches(events):
+    """Non-ad events with a parsed timestamp, oldest first."""
+    watched = events[~events['is_ad'] & events['watched_at'].notna()]
+    return watched.sort_values('watched_at', kind='stable')
+
+
+def per_day(events):
+    """Number of videos watched on each calendar day, including days with none."""
+    return watches(events).set_index('watched_at').resample('D').size()
+
+
+def by_hour(events):
+    """Number of videos watched in each hour of the day (0-23)."""
+    hours = watches(events)['watched_at'].dt.hour
+    return hours.value_counts().reindex(range(24), fill_value=0)
+
+
+def by_weekday(events):
+    """Number of videos watched on each day of the week, Monday first."""
+    days = watches(events)['watched_at'].dt.dayofweek
+    counts = days.value_counts().reindex(range(7), fill_value=0)
+    counts.index = WEEKDAYS
+    return counts
+
+
+def sessions(events, gap='30min'):
+    """Group watches into binge sessions, where consecutive watches are at most `gap` apart.
+
+    Returns
+    -------
+    sessions : DataFrame
+        start, end, videos and length of each session, longest (by number of videos) first
+    """
+    watched = watches(events)['watched_at']
+    session = (watched.diff() > pd.Timedelta(gap)).cumsum()
+    grouped = watched.groupby(session.to_numpy())
+    result = pd.DataFrame({'start': grouped.min(), 'end': grouped.max(), 'videos': grouped.size()})
+    result['length'] = result['end'] - result['start']
+    return result.sort_values(['videos', 'length'], ascending=False, kind='stable').reset_index(drop=True)
+
+
+def rewatches(events):
+    """Number of times each video was watched, for videos watched more than once."""
+    counts = watches(events)['video_url'].value_counts()
+    return counts[counts > 1]
+
+
+def first_watched(events, df, n=10):
+    """Positions in `df` of the first `n` distinct videos watched, oldest first."""
+    urls = watches(events)['video_url'].dropna().astype(object).drop_duplicates()
+    positions = pd.Series(np.arange(len(df)), index=df['id'].to_numpy())
+    positions = positions[~positions.index.duplicated()]
+    rows = positions.reindex(video_ids(urls).to_numpy()).dropna().astype(int)
+    return rows.to_numpy()[:n]
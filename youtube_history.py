@@ -3,6 +3,9 @@
 
 """
 Downloads, analyzes, and reports all Youtube videos associated with a user's Google account.
+
+pandas, numpy and the other heavy dependencies are imported by the stages that use them,
+so `--serve-only` can serve the last report without loading any of them.
 """
 
 import json
@@ -15,44 +18,23 @@ import sys
 from collections import namedtuple
 from getpass import getuser
 from pathlib import Path
-from webbrowser import open_new_tab
-
-import pandas as pd
-import numpy as np
 
-from bs4 import BeautifulSoup
-from emoji import emoji_list
-from flask import Flask
-from flask import render_template
 from loguru import logger
-from tqdm import tqdm
-from wordcloud import WordCloud
-
-from grapher import Grapher, flatten_without_nones
-
 
-app = Flask(__name__)
+from downloader import UNAVAILABLE_TTL, Downloader, Manifest, YtDlpLog
+from metrics import DERIVED, Rows, comment_to_view, fingerprint, fingerprint_hashes, metric
+from profiling import Profiler
+from report import render_report
+from store import DEFAULT_KEYS, MetadataStore
+from takeout import WATCH_HISTORY, video_id
 
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
-    return render_template('index.html', analysis=analysis)
-
-
-def launch_web(analysis):
-    app.debug = True
-    app.secret_key = "this is not real"
-    some_data = (analysis.raw / '00001.info.json').is_file()
-    if some_data:
-        url = 'http://127.0.0.1:5000'
-        open_new_tab(url)
-        app.run()
+# Stands in for a video in the report when there isn't one. Defined here so metric results can be pickled.
+FakeSeries = namedtuple('FakeSeries', ['title', 'webpage_url', 'likes_pct'], defaults=('N/A', 'N/A', 'N/A'))
 
 
 def make_fake_series(title='N/A', webpage_url='N/A', **kwargs):
-    params = ['title', 'webpage_url'] + list(kwargs.keys())
-    Mock = namedtuple('MockSeries', params)
-    return Mock(title, webpage_url, **kwargs)
+    return FakeSeries(title, webpage_url, **kwargs)
 
 
 class Analysis:
@@ -66,6 +48,32 @@ class Analysis:
         The path to the directory where both raw and computed results should be stored.
     name : Optional[str]
         Subdir of out_base where this particular analysis should be stored (e.g. 'jessime')
+    workers : Optional[int]
+        If given, download with this many parallel workers, resuming from `manifest.json`.
+        Otherwise a single yt-dlp subprocess is used.
+    keep_keys : Optional[[str]]
+        If given, parallel downloads keep only these info.json keys, appending them to a single
+        compressed `metadata.jsonl.gz` instead of writing one file per video.
+    update : bool (default=False)
+        Only download and ingest the videos in the Takeout that aren't in the cache yet
+    processes : Optional[int]
+        Number of processes used to read json files. Defaults to the number of CPUs.
+    keywords : [str] (default=['funny'])
+        Words to count in video descriptions. The video that says each one the most is reported.
+    shared : Optional[SharedLibrary]
+        If given, video metadata comes from this library shared with other users (see `batch.py`),
+        and this analysis only keeps its own watch events.
+    lazy_text : bool (default=False)
+        Leave descriptions out of the dataframe until a metric that reads them is computed
+    profile : bool (default=False)
+        Run each stage under cProfile, saving its stats and a json summary of every stage in `ran/profile/`
+    unavailable_ttl : Optional[float] (default=30 days)
+        Seconds before videos that couldn't be downloaded are tried again. None never retries them.
+    approximate : bool (default=False)
+        Find deciles and the most common channels and languages with bounded-memory sketches (see `sweep.Sweep`)
+    stream : bool (default=False)
+        Download and ingest videos as soon as they're parsed, exporting a partial report to `partial/`
+        every minute (see `pipeline.Pipeline`)
 
     Attributes
     ----------
@@ -74,11 +82,22 @@ class Analysis:
     ran : str
         Path to 'ran' directory in self.path directory
     df : Dataframe
-        Pandas Dataframe used to store compiled results
-    tags : [[str]]
-        A list of tags for each downloaded video
+        Pandas Dataframe used to store compiled results, with the compact dtypes in `ingest.DTYPES`
+    frame : DataFrame
+        df plus derived columns (likes_pct, deciles, comment_to_view, webpage_url), used for displaying rows
+    video_index : VideoIndex
+        Answers the JSON API's queries (see `query.py`)
+    tags : TagStore
+        The tags of each downloaded video
+    events : DataFrame
+        Every watch event in the history, with its timestamp (see `takeout.read_watch_events`)
     grapher : Grapher
         Creates the interactive graphs portion of the analysis
+    profiler : Profiler
+        Time, memory and throughput of each stage (parsing, downloading, ingestion, metrics, charts...)
+
+    The attributes below are metrics (see `metrics.metric`). Each is computed the first time it's read,
+    and saved in `ran/metrics/` for later runs on the same data.
 
     seconds : int
         The sum of video durations
@@ -104,52 +123,177 @@ class Analysis:
         The number of videos that have ultra-high-definition resolution
     top_uploaders : Series
         The most watched channel names with corresponding video counts
-    funny_counts : int
-        The max number of times a video's description says the word 'funny'
-    funny : Series
-        The 'funniest' video as determined by funny_counts
+    text_counts : (Series, DataFrame)
+        Number of distinct emojis, and of each keyword, in every description (see `textscan.scan_descriptions`)
+    keyword_counts : {str: int}
+        The max number of times a video's description says each keyword (e.g. 'funny')
+    keyword_videos : {str: Series}
+        The video with the most mentions of each keyword (e.g. the 'funniest' video)
+    by_hour : Series
+        Number of videos watched in each hour of the day
+    by_weekday : Series
+        Number of videos watched on each day of the week
+    longest_session : Series
+        The binge session with the most videos watched back to back
+    rewatched : DataFrame
+        The videos watched the most times, with a `watches` column
     """
-    def __init__(self, takeout=None, out_base='data', name=None):
+    def __init__(self, takeout=None, out_base='data', name=None, workers=None, keep_keys=None, update=False,
+                 processes=None, keywords=('funny',), shared=None, lazy_text=False, profile=False,
+                 stream=False, approximate=False, unavailable_ttl=UNAVAILABLE_TTL):
         self.takeout = None if takeout is None else Path(takeout).expanduser()
         if name is None:
             name = getuser()
         self.name = name
+        self.workers = workers
         self.path = Path(out_base) / self.name
         self.raw = self.path / 'raw'
         self.ran = self.path / 'ran'
-        self.df = None
+        self.keep_keys = keep_keys
+        self.update = update
+        self.processes = processes
+        self.keywords = list(keywords)
+        self.shared = shared
+        self.lazy_text = lazy_text
+        self.stream = stream
+        self.approximate = approximate
+        self.unavailable_ttl = unavailable_ttl
+        self.profiler = Profiler(self.ran / 'profile' if profile else None)
+        self.store = MetadataStore(self.path / 'metadata.jsonl.gz', keep_keys or DEFAULT_KEYS)
+        from cache import ColumnCache
+        self.cache = ColumnCache(self.ran / 'videos.parquet')
+        self._df = None
+        self._events = None
+        self._fingerprints = {}
+        self._frame = None
+        self._wordcloud = None
+        self._video_index = None
         self.tags = None
         self.grapher = None
 
         self.ad_count = None
-        self.seconds = None
-        self.formatted_time = None
-        self.most_viewed = None
-        self.least_viewed = None
-        self.best_per_decile = None
-        self.worst_per_decile = None
-        self.emojis = None
-        self.oldest_videos = None
-        self.oldest_upload = None
-        self.most_comments = None
-        self.highest_comment_ratio = None
-        self.top_uploaders = None
-        self.funny = None
-        self.funny_counts = None
-        self.primary_lang = None
-        self.primary_lang_count = None
-        self.other_langs_count = None
-        self.best_per_lang = None
+        self.text_counts = None
+
+    @property
+    def df(self):
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self.reset_metrics()
+
+    @property
+    def events(self):
+        return self._events
+
+    @events.setter
+    def events(self, events):
+        self._events = events
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        """Forget computed metrics, e.g. because the dataframe changed. Results saved to disk are kept."""
+        for metric in self.metrics.values():
+            for attr in metric.returns:
+                self.__dict__.pop(attr, None)
+        self._fingerprints = {}
+        self._frame = None
+        self._video_index = None
+        self.text_counts = None
+
+    def column_fingerprint(self, column):
+        """A hash of a column's values, without loading it if it was left in the cache (see `lazy_text`).
+
+        The column is hashed with its compact dtype, and a column left in the cache from the row hashes
+        saved with it, so the same values give the same fingerprint whether they're loaded or not.
+        """
+        if column not in self._fingerprints:
+            from ingest import compact
+            if column in self.df:
+                self._fingerprints[column] = fingerprint(compact(self.df[[column]])[column])
+                return self._fingerprints[column]
+            hashes = self.source_cache().row_hashes(column, self.df['id'])
+            if hashes is None:
+                self.require([column])
+                return self.column_fingerprint(column)
+            self._fingerprints[column] = fingerprint_hashes(hashes)
+        return self._fingerprints[column]
+
+    def events_fingerprint(self):
+        """A hash of the watch events. Parquet stores timestamps in ms, so they're hashed in ns either way."""
+        if 'events' not in self._fingerprints:
+            if self.events is None:
+                self._fingerprints['events'] = 'None'
+            else:
+                events = self.events.assign(watched_at=self.events['watched_at'].astype('datetime64[ns]'))
+                self._fingerprints['events'] = fingerprint(events)
+        return self._fingerprints['events']
+
+    def source_cache(self):
+        """The cache the dataframe is loaded from: this analysis's, or the shared library's."""
+        return self.cache if self.shared is None else self.shared.cache
+
+    def eager_columns(self):
+        """The cached columns loaded up front. With `lazy_text`, descriptions wait for `require`."""
+        from ingest import TEXT_COLUMNS
+        cache = self.source_cache()
+        return [col for col in cache.columns if not (self.lazy_text and col in TEXT_COLUMNS)]
+
+    def require(self, columns):
+        """Load any of `columns` that the dataframe was built without, matching rows by video id.
+
+        This doesn't count as a change to the dataframe, so computed metrics are kept.
+        """
+        missing = [col for col in columns if col not in self.df]
+        if not missing:
+            return
+        logger.info(f'Loading {", ".join(missing)}')
+        cache = self.source_cache()
+        loaded = cache.load(['id'] + missing).drop_duplicates('id').set_index('id').reindex(self.df['id'])
+        self._df = self.df.assign(**{col: loaded[col].set_axis(self.df.index) for col in missing})
+        self._frame = None
+
+    @property
+    def frame(self):
+        """The dataframe plus derived columns like `likes_pct`, without modifying `self.df`."""
+        if self._frame is None:
+            self._frame = self.df.assign(**{name: func(self.df) for name, func in DERIVED.items()})
+        return self._frame
+
+    @property
+    def video_index(self):
+        """The index behind the JSON API, built on first use and again whenever the dataframe changes."""
+        if self._video_index is None:
+            from query import VideoIndex
+            with self.profiler.stage('index', items=len(self.df)):
+                self._video_index = VideoIndex(self.frame, self.tags)
+        return self._video_index
 
     def setup_dirs(self):
         self.raw.mkdir(parents=True, exist_ok=True)
         self.ran.mkdir(parents=True, exist_ok=True)
 
-    def get_soup(self):
-        watch_history = self.takeout / 'YouTube and YouTube Music/history/watch-history.html'
+    def has_data(self):
+        """Whether any video json has been downloaded.
+
+        Parallel downloads number files by history position, so `00001.info.json` may be missing
+        if the first video was unavailable.
+        """
+        if self.shared is not None:
+            return self.shared.cache.exists()
+        return self.store.exists() or next(self.raw.glob('*.info.json'), None) is not None
+
+    def watch_history(self):
+        watch_history = self.takeout / WATCH_HISTORY
         if not watch_history.is_file():
             raise ValueError(f'"{watch_history}" is not a file. Did you download your YouTube data? ')
         logger.info('Extracting video urls from Takeout.'); sys.stdout.flush()
+        return watch_history
+
+    def get_soup(self):
+        from bs4 import BeautifulSoup
+        watch_history = self.watch_history()
         try:
             text = watch_history.read_text()
         except UnicodeDecodeError:
@@ -177,83 +321,296 @@ class Analysis:
                 ad_count += 1
         deduped_vids = list(dict.fromkeys(videos))
         return deduped_vids, ad_count  
-    
+
+    def parse_history(self):
+        """Extract every watch event, without building the whole html tree in memory.
+
+        The events are saved to `ran/events.parquet`. Returns the same urls and ad count
+        as `self.parse_soup(self.get_soup())`.
+        """
+        from takeout import read_watch_events, urls_from_events
+        with self.profiler.stage('parse') as stage:
+            self.events = read_watch_events(self.watch_history())
+            self.events.to_parquet(self.ran / 'events.parquet')
+            stage.items = len(self.events)
+        videos, self.ad_count = urls_from_events(self.events)
+        return videos, self.ad_count
+
+    def check_events(self):
+        """Load the watch events, parsing the Takeout if they haven't been saved yet."""
+        if self.events is not None:
+            return
+        events_file = self.ran / 'events.parquet'
+        if events_file.is_file():
+            import pandas as pd
+            self.events = pd.read_parquet(events_file)
+        elif self.takeout is not None:
+            self.parse_history()
+
+    def open_manifest(self):
+        """The download progress and negative cache of unavailable videos, from `manifest.json`."""
+        return Manifest(self.path / 'manifest.json', self.unavailable_ttl)
+
     def download_data(self):
-        """Uses Takeout to download individual json files for each video."""
-        soup = self.get_soup()
-        videos, _ = self.parse_soup(soup)
+        """Uses Takeout to download individual json files for each video.
+
+        Videos that are already downloaded or known to be unavailable are left out of yt-dlp's batch file.
+        Its output is read to record the file of each video, and why the others failed, in `manifest.json`.
+        """
+        videos, _ = self.parse_history()
         url_path = self.path / 'urls.txt'
         url_path.write_text('\n'.join(videos))
-        logger.info(f'Urls extracted. Downloading data for {len(videos)} videos now.')
+        manifest = self.open_manifest()
+        todo = [url for _, url in manifest.pending(videos)]
+        todo_path = self.path / 'todo.txt'
+        todo_path.write_text('\n'.join(todo))
+        logger.info(f'Urls extracted. Downloading data for {len(todo)} of {len(videos)} videos now.')
         output = self.raw / '%(autonumber)s'
-        cmd = f'yt-dlp -o "{output}" --skip-download --write-info-json -i -a {url_path}'
-        p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, shell=True)
-        line = True
-        while line:
-            line = p.stdout.readline().decode("utf-8").strip()
-            logger.info(line)
+        cmd = (f'yt-dlp -o "{output}" --autonumber-start {manifest.last_number + 1} '
+               f'--skip-download --write-info-json -i -a {todo_path}')
+        log = YtDlpLog(manifest)
+        with self.profiler.stage('download', items=0) as stage:
+            p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.STDOUT, shell=True)
+            for raw_line in iter(p.stdout.readline, b''):
+                line = raw_line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                logger.info(line)
+                if log.read(line) == 'done':
+                    stage.items += 1
+            p.wait()
+        manifest.save()
+
+    def download_data_parallel(self, extractor=None):
+        """Download json files for each video with a pool of workers, skipping finished videos.
+
+        Progress is tracked in `manifest.json`, so rerunning after an interruption only
+        fetches the videos that are still missing.
+        """
+        videos, _ = self.parse_history()
+        url_path = self.path / 'urls.txt'
+        url_path.write_text('\n'.join(videos))
+        manifest = self.open_manifest()
+        store = None if self.keep_keys is None else self.store
+        downloader = Downloader(self.raw, manifest, extractor, workers=self.workers, store=store)
+        with self.profiler.stage('download') as stage:
+            counts = downloader.run(videos, offset=manifest.last_number)
+            stage.items = counts['done']
+        logger.info(f"Downloaded {counts['done']} videos, {counts['failed']} unavailable, "
+                    f"{counts['pending']} left for the next run.")
+
+    def stream_data(self, extractor=None):
+        """Parse, download and ingest at the same time, resuming from `manifest.json` like `download_data_parallel`.
+
+        The dataframe is cached when it's done, so `start_analysis` only has the metrics and charts left to do.
+        """
+        from pipeline import Pipeline
+        Pipeline(self, extractor, workers=self.workers or 8).run()
+
+    @property
+    def tag_counts(self):
+        """The most common tags and their counts, from `ran/tag_counts.parquet` if the tags aren't loaded."""
+        import cloud
+        if self.tags is None:
+            return cloud.load_frequencies(self.ran / 'tag_counts.parquet')
+        return cloud.frequencies(self.tags)
+
+    @property
+    def wordcloud_path(self):
+        """The wordcloud image, named after a hash of the tag counts, so it changes whenever they do."""
+        import cloud
+        return Path(f"static/images/{self.name}_wordcloud_{cloud.content_key(self.tag_counts)}.png")
+
+    def iter_metas(self, ids=None, manifest=None):
+        """Yield the info dict of every downloaded video, from the store and any files written without it.
+
+        If `ids` is given, only those videos are read, using `manifest` to find their files.
+        """
+        if ids is not None:
+            filenames = {vid: manifest.done[vid] for vid in ids if vid in manifest.done}
+            if self.store.path.name in filenames.values():
+                yield from (meta for meta in self.store if meta.get('id') in filenames)
+            for filename in filenames.values():
+                if filename != self.store.path.name:
+                    with open(self.raw / filename) as f:
+                        yield json.load(f)
+        elif self.store.exists():
+            # Videos downloaded before the store was used are still in their own files
+            stored = set()
+            for meta in self.store:
+                stored.add(meta.get('id'))
+                yield meta
+            yield from (meta for meta in self.iter_files() if meta.get('id') not in stored)
+        else:
+            yield from self.iter_files()
+
+    def iter_files(self):
+        """Yield the info dict of every json file in the raw directory."""
+        from tqdm import tqdm
+        for raw_path in tqdm(sorted(self.raw.glob("*.json"))):
+            with open(raw_path) as f:
+                yield json.load(f)
+
+    def order_by_history(self, df, tags, positions=None):
+        """Sort videos by their position in `urls.txt`, most recently watched first.
+
+        Videos that are no longer in the history keep their relative order at the end.
+        `positions` maps video ids to their position, if the urls have been parsed but not saved yet.
+        """
+        if positions is None:
+            url_path = self.path / 'urls.txt'
+            if not url_path.is_file():
+                return df, tags
+            positions = {video_id(url): i for i, url in enumerate(url_path.read_text().split())}
+        if df.empty:
+            return df, tags
+        import numpy as np
+        pos = df['id'].map(positions).astype(float).fillna(len(positions))
+        order = np.argsort(pos.to_numpy(), kind='stable')
+        return df.iloc[order].reset_index(drop=True), tags.take(order)
+
+    def frame_from_metas(self, metas):
+        """Constructs a Dataframe and list of tags from an iterable of info dicts."""
+        from ingest import columns_from_metas, frame_from_columns
+        return frame_from_columns(columns_from_metas(metas))
 
     def df_from_files(self):
         """Constructs a Dataframe from the downloaded json files.
 
-        All json keys whose values are not lists are compiled into the dataframe.
-        The dataframe is then saved as a pickle file in the self.ran directory.
-        The tags of each video are pickled and saved as `tags.pkl`
+        The keys in `KEYS_AND_DEFAULTS` are compiled into the dataframe,
+        and the tags of each video are kept separately in `self.tags`.
+        Files are decoded in parallel by `self.processes` worker processes.
         """
+        from ingest import frame_from_columns, read_files_parallel
+        from tags import TagStore
         logger.info('Creating dataframe...')
-        raw_paths = sorted(self.raw.glob("*.json"))
-        video_metas = []
-        keys_and_defaults = {"like_count": pd.NA,
-                             "comment_count": pd.NA, 
-                             "duration": pd.NA, 
-                             "view_count": pd.NA, 
-                             "upload_date": pd.NaT, 
-                             "description": "", 
-                             "height": pd.NA, 
-                             "title": "", 
-                             "webpage_url": "", 
-                             "uploader": "",
-                             "language": ""}
-        tags = []
-        for raw_path in tqdm(raw_paths):
-            meta = json.load(open(raw_path))
-            tags.append(meta.get("tags", []))
-            meta_to_keep = {k: meta.get(k, d) for k, d in keys_and_defaults.items()}
-            video_metas.append(meta_to_keep)
-        self.df = pd.DataFrame(video_metas)
-        self.df['upload_date'] = pd.to_datetime(self.df['upload_date'], format='%Y%m%d')
-        self.tags = tags
+        with self.profiler.stage('ingest') as stage:
+            if self.store.exists():
+                df, tags = self.frame_from_metas(self.iter_metas())
+            else:
+                columns = read_files_parallel(sorted(self.raw.glob("*.json")), self.processes)
+                df, tags = frame_from_columns(columns)
+            self.df, self.tags = self.order_by_history(df, TagStore.from_lists(tags))
+            stage.items = len(self.df)
 
+    def update_data(self, extractor=None):
+        """Download and ingest only the videos in the Takeout that aren't in the cache yet.
+
+        New videos are added to the cached dataframe and tags.
+        """
+        self.check_df()
+        manifest = self.open_manifest()
+        known = set(self.df['id']) | manifest.done.keys()
+        videos, _ = self.parse_history()
+        (self.path / 'urls.txt').write_text('\n'.join(videos))
+        new_urls = [url for url in videos
+                    if video_id(url) not in known and not manifest.is_unavailable(video_id(url))]
+        logger.info(f'{len(new_urls)} new videos since the last analysis.')
+        if not new_urls:
+            return
+        numbered = [int(p.name.split('.')[0]) for p in self.raw.glob('*.info.json') if p.name[0].isdigit()]
+        offset = max([manifest.last_number] + numbered)
+        store = None if self.keep_keys is None and not self.store.exists() else self.store
+        downloader = Downloader(self.raw, manifest, extractor, workers=self.workers or 4, store=store)
+        with self.profiler.stage('download') as stage:
+            stage.items = downloader.run(new_urls, offset=offset)['done']
+        self.add_videos({video_id(url) for url in new_urls}, manifest)
+
+    def uncached_ids(self, manifest):
+        """Ids of downloaded videos the cached dataframe doesn't have, e.g. those fetched by a resumed `--workers` run."""
+        cached = set(self.df['id'])
+        return {vid for vid, filename in manifest.done.items()
+                if vid not in cached and (filename == self.store.path.name or (self.raw / filename).is_file())}
+
+    def add_videos(self, ids, manifest):
+        """Ingest the downloaded videos `ids`, adding them to the cached dataframe and tags."""
+        self.require(self.cache.columns)
+        with self.profiler.stage('ingest') as stage:
+            new_df, new_tags = self.frame_from_metas(self.iter_metas(ids, manifest))
+            stage.items = len(new_df)
+        logger.info(f'Adding {len(new_df)} videos to the cache.')
+        import pandas as pd
+        from tags import TagStore
+        df = pd.concat([new_df, self.df], ignore_index=True)
+        tags = TagStore.concat([TagStore.from_lists(new_tags), self.tags])
+        self.df, self.tags = self.order_by_history(df, tags)
+        self.cache.save(self.df, self.tags)
+        self.df = self.cache.load(self.eager_columns())
+
+    def videos_with_tag(self, tag):
+        """The rows of the dataframe for videos tagged with `tag`."""
+        return self.df.iloc[self.tags.rows_with(tag)]
 
     def make_wordcloud(self):
-        """Generate the wordcloud file and save it to static/images/."""
-        wordcloud_path = Path(f"static/images/{self.name}_wordcloud.png")
-        if wordcloud_path.is_file():
+        """Start drawing the wordcloud of the tag counts into static/images/, unless it's already there.
+
+        The counts are saved to `ran/tag_counts.parquet`. The image is drawn by a background worker,
+        so use `wordcloud_image` to wait for it. Images of older counts are removed.
+        Inside a worker process the image is drawn right away, and that time counts towards this stage.
+        """
+        import cloud
+        with self.profiler.stage('wordcloud', items=len(self.tags.codes)):
+            counts = self.tag_counts
+            cloud.save_frequencies(counts, self.ran / 'tag_counts.parquet')
+            wordcloud_path = self.wordcloud_path
+            if wordcloud_path.is_file():
                 logger.info(f"Wordcloud found at: {wordcloud_path}")
-        else:
+                return
             logger.info('Creating wordcloud')
-            wordcloud = WordCloud(width=1920,
-                                height=1080,
-                                relative_scaling=.5)
-            flat_tags = flatten_without_nones(self.tags)
-            wordcloud.generate(' '.join(flat_tags))
-            wordcloud.to_file(wordcloud_path)
+            for old in wordcloud_path.parent.glob(f'{self.name}_wordcloud*.png'):
+                old.unlink()
+            self._wordcloud = cloud.draw_in_background(counts, wordcloud_path)
+
+    def wordcloud_image(self):
+        """The path of the wordcloud, waiting for its worker to finish drawing it if need be."""
+        if self._wordcloud is not None:
+            with self.profiler.stage('wordcloud.wait'):
+                self._wordcloud.result()
+            self._wordcloud = None
+        return self.wordcloud_path
 
     def check_df(self):
-        """Create the dataframe and tags from files if file doesn't exist."""
+        """Load the dataframe and tags from the cache, creating it from files if it doesn't exist.
+
+        Results pickled by older versions (`df.pkl` and `tags.pkl`) are migrated to the cache.
+        Videos the manifest lists as downloaded but the cache doesn't have yet are added to it.
+        With a shared library, the videos in `urls.txt` are selected from its cache instead.
+        """
+        import pandas as pd
+        from takeout import video_ids
+        from tags import TagStore
+        if self.shared is not None:
+            ids = video_ids(pd.Series((self.path / 'urls.txt').read_text().split(), dtype=object))
+            with self.profiler.stage('load') as stage:
+                self.df, self.tags = self.order_by_history(*self.shared.load(ids, self.eager_columns()))
+                stage.items = len(self.df)
+            return
         df_file = self.ran / 'df.pkl'
+        if self.cache.exists():
+            with self.profiler.stage('load') as stage:
+                self.df = self.cache.load(self.eager_columns())
+                self.tags = self.cache.load_tags()
+                stage.items = len(self.df)
+            manifest = self.open_manifest()
+            new_ids = self.uncached_ids(manifest)
+            if new_ids:
+                logger.info(f'{len(new_ids)} downloaded videos are missing from the cache.')
+                self.add_videos(new_ids, manifest)
+            return
         if df_file.is_file():
             self.df = pd.read_pickle(df_file)
-            self.tags = pickle.load(open(self.ran / 'tags.pkl', 'rb'))
+            with open(self.ran / 'tags.pkl', 'rb') as f:
+                self.tags = TagStore.from_lists(pickle.load(f))
         else:
             self.df_from_files()
-            self.df.to_pickle(self.ran / 'df.pkl')
-            pickle.dump(self.tags, open(self.ran / 'tags.pkl', 'wb'))
+        self.cache.save(self.df, self.tags)
+        self.df = self.cache.load(self.eager_columns())
 
+    @metric('duration', returns=('seconds', 'formatted_time'))
     def total_time(self):
         """The amount of time spent watching videos."""
-        self.seconds = self.df["duration"].sum()
-        seconds = self.seconds
+        seconds = self.df["duration"].sum()
+        total = seconds
         intervals = (
             ('years', 31449600),  # 60 * 60 * 24 * 7 * 52
             ('weeks', 604800),    # 60 * 60 * 24 * 7
@@ -272,96 +629,130 @@ class Analysis:
                 if value == 1:
                     name = name.rstrip('s')
                 result.append("{} {}".format(int(value), name))
-        self.formatted_time = ', '.join(result)
+        return {'seconds': total, 'formatted_time': ', '.join(result)}
 
-    def best_and_worst_videos(self):
-        """Finds well liked and highly viewed videos
-        
-        Note that Youtube has removed the dislike count, 
+    @metric('view_count', 'like_count', 'uploader', 'language', params=('approximate',),
+            returns=('most_viewed', 'least_viewed', 'best_per_decile', 'worst_per_decile', 'top_uploaders',
+                     'primary_lang', 'primary_lang_count', 'other_langs_count', 'best_per_lang'))
+    def sweep_videos(self):
+        """Finds well liked and highly viewed videos, and the most common channels and languages, in one pass.
+
+        Note that Youtube has removed the dislike count,
         so we have to get a bit creative about what we're analyzing.
         """
-        self.most_viewed = self.df.loc[self.df['view_count'].idxmax()]
-        low_views = self.df[self.df['view_count'] < 10]
-        self.least_viewed = low_views.sample(min(len(low_views), 10), random_state=0)
-        self.df['likes_pct'] = ((self.df["like_count"] / self.df["view_count"])  * 100).fillna(0).round(4)
-        self.df['deciles'] = pd.qcut(self.df['view_count'].fillna(0), 10, labels=False)
-        grouped = self.df.groupby(by='deciles')
-        self.best_per_decile = self.df.iloc[grouped['likes_pct'].idxmax()].reset_index()
-        self.worst_per_decile = self.df.iloc[grouped['likes_pct'].idxmin()].reset_index()
-
+        from sweep import Sweep
+        swept = Sweep(self.approximate)
+        swept.update(self.df)
+        results = swept.result()
+        uploaders = results['uploaders']
+        languages = results['languages'].drop("", errors='ignore')
+        primary_lang = languages.index[0]
+        other_langs_count = languages.drop(primary_lang)
+        best_per_lang = results['best_per_language']
+        best_per_lang = best_per_lang[best_per_lang.index.isin(other_langs_count.index)]
+        return {'most_viewed': Rows(results['most_viewed']),
+                'least_viewed': Rows(results['least_viewed']),
+                'best_per_decile': Rows(results['best_per_decile'], reset_index=True),
+                'worst_per_decile': Rows(results['worst_per_decile'], reset_index=True),
+                'top_uploaders': uploaders.head(n=15),
+                'primary_lang': primary_lang,
+                'primary_lang_count': languages.iloc[0],
+                'other_langs_count': other_langs_count,
+                'best_per_lang': Rows(best_per_lang.to_numpy())}
+
+    def scan_text(self):
+        """Counts emojis and keywords in every description in a single scan, reused by the text metrics."""
+        if self.text_counts is None:
+            from textscan import scan_descriptions
+            self.text_counts = scan_descriptions(self.df['description'], self.keywords)
+        return self.text_counts
+
+    @metric('description', returns=('emojis',))
     def most_emojis_description(self):
-        def _emoji_variety(desc):
-            return len({x['emoji'] for x in emoji_list(desc)})
-
-        counts = self.df['description'].apply(_emoji_variety)
-        self.emojis = self.df.iloc[counts.idxmax()]
-
-    def funniest_description(self):
-        """Counts number of times 'funny' is in each description. Saves top result."""
-        funny_counts = []
-        descriptions = []
-        index = []
-        for i, d in enumerate(self.df["description"]):
-            try:
-                funny_counts.append(d.lower().count('funny'))
-                descriptions.append(d)
-                index.append(i)
-            except AttributeError:
-                pass
-        funny_counts = np.array(funny_counts)
-        funny_counts_idx = funny_counts.argmax()
-        self.funny_counts = funny_counts[funny_counts_idx]
-        if self.funny_counts > 0:
-            self.funny = self.df.iloc[index[funny_counts_idx]]
-        else:
-            title = 'Wait, 0? You\'re too cool to watch funny videos on youtube?'
-            self.funny = make_fake_series(title, average_rating='N/A')
+        emojis, _ = self.scan_text()
+        return {'emojis': Rows(emojis.to_numpy().argmax())}
+
+    @metric('description', returns=('keyword_counts', 'keyword_videos'), params=('keywords',))
+    def keyword_descriptions(self):
+        """Counts number of times each keyword is in each description. Saves top result per keyword."""
+        keyword_counts = {}
+        keyword_videos = {}
+        _, text_counts = self.scan_text()
+        for keyword in self.keywords:
+            counts = text_counts[keyword].to_numpy()
+            top = counts.argmax()
+            keyword_counts[keyword] = int(counts[top])
+            if counts[top] > 0:
+                keyword_videos[keyword] = Rows(top)
+            else:
+                title = f'Wait, 0? You\'re too cool to watch {keyword} videos on youtube?'
+                keyword_videos[keyword] = make_fake_series(title, likes_pct='N/A')
+        return {'keyword_counts': keyword_counts, 'keyword_videos': keyword_videos}
 
+    @metric('comment_count', 'view_count', returns=('most_comments', 'highest_comment_ratio'))
     def chatty(self):
         "Finds videos with lots of comments"
-        self.most_comments = self.df.loc[self.df["comment_count"].idxmax()]
-        self.df["comment_to_view"] = self.df["comment_count"] / self.df["view_count"]
-        chatty = self.df[self.df["comment_count"] > 100]
+        ratio = comment_to_view(self.df)
+        chatty = ratio[self.df["comment_count"] > 100]
         if chatty.empty:  # No videos have more than 100 comments
-            chatty = self.df[self.df["comment_count"] > 10]
-        self.highest_comment_ratio = chatty.loc[chatty["comment_to_view"].idxmax()]
-
-    def three_randoms(self):
-        """Finds results for video resolutions, most popular channels, and funniest video."""
-        self.chatty()
-        self.top_uploaders = self.df["uploader"].value_counts().head(n=15)
-        self.funniest_description()
-
-    def by_language(self):
-        """Finds videos in other languages."""
-        raw_counts = self.df["language"].value_counts().drop("")
-        self.primary_lang = raw_counts.idxmax()
-        self.primary_lang_count = raw_counts.max()
-        self.other_langs_count = raw_counts.drop(self.primary_lang)
-        other_langs_df = self.df[self.df["language"].isin(self.other_langs_count.index)]
-        by_lang = other_langs_df.groupby("language")
-        liked_idxs = by_lang["likes_pct"].idxmax()
-        self.best_per_lang = other_langs_df.loc[liked_idxs]
+            chatty = ratio[self.df["comment_count"] > 10]
+        return {'most_comments': Rows(self.df["comment_count"].idxmax()),
+                'highest_comment_ratio': Rows(chatty.idxmax())}
+
+    @metric('upload_date', returns=('oldest_upload',))
+    def oldest_upload_date(self):
+        return {'oldest_upload': Rows(self.df['upload_date'].idxmin())}
+
+    @metric('id', 'title', events=True,
+            returns=('oldest_videos', 'by_hour', 'by_weekday', 'longest_session', 'rewatched'))
+    def watch_times(self):
+        """Finds when videos are watched, binge sessions and rewatches from the watch events.
+
+        Without events, the oldest videos are the last ones in the history and the rest is None.
+        """
+        import numpy as np
+        import pandas as pd
+        import timeseries
+        from takeout import video_ids
+        columns = ['title', 'webpage_url']
+        if self.events is None:
+            oldest = Rows(np.arange(max(len(self.df) - 10, 0), len(self.df)), columns)
+            return {'oldest_videos': oldest, 'by_hour': None, 'by_weekday': None,
+                    'longest_session': None, 'rewatched': None}
+        sessions = timeseries.sessions(self.events)
+        watches = timeseries.rewatches(self.events).head(10)
+        urls = pd.DataFrame({'url': watches.index.astype(object), 'watches': watches.to_numpy()})
+        urls['id'] = video_ids(urls['url'])
+        return {'oldest_videos': Rows(timeseries.first_watched(self.events, self.df), columns),
+                'by_hour': timeseries.by_hour(self.events),
+                'by_weekday': timeseries.by_weekday(self.events),
+                'longest_session': sessions.iloc[0] if len(sessions) else None,
+                'rewatched': urls.merge(self.df[['id', 'title']], on='id', how='left')}
 
     def compute(self):
+        """Computes every metric now, instead of when the report first reads it."""
         logger.info('Computing...')
-        self.total_time()
-        self.best_and_worst_videos()
-        self.most_emojis_description()
-        self.oldest_videos = self.df[['title', 'webpage_url']].tail(n=10)
-        self.oldest_upload = self.df.loc[self.df['upload_date'].idxmin()]
-        self.three_randoms()
-        self.by_language()
+        for name, metric in self.metrics.items():
+            with self.profiler.stage(f'metric.{name}', items=len(self.df)):
+                metric.compute(self)
 
     def graph(self):
-        self.grapher = Grapher(self.df, self.tags)
-        self.grapher.average_rating()
-        self.grapher.duration()
-        self.grapher.views()
-        self.grapher.gen_tags_plot()
+        from grapher import Grapher
+        self.grapher = Grapher(self.frame, self.tags)
+        for chart in ('average_rating', 'duration', 'views', 'gen_tags_plot'):
+            with self.profiler.stage(f'graph.{chart}', items=len(self.df)):
+                getattr(self.grapher, chart)()
+
+    def render(self, static, wordcloud_url):
+        """Render the report for the server, saving it for `--serve-only` (see `server.SavedReport`)."""
+        html = render_report(self, static, wordcloud_url)
+        (self.ran / 'report.html').write_text(html, encoding='utf-8')
+        (self.ran / 'report.json').write_text(json.dumps({'wordcloud': str(self.wordcloud_path)}))
+        return html
 
     def start_analysis(self):
         self.check_df()
+        self.check_events()
         self.make_wordcloud()
         self.compute()
         self.graph()
@@ -369,10 +760,16 @@ class Analysis:
     def run(self):
         """Main function for downloading and analyzing data."""
         self.setup_dirs()
-        some_data = (self.raw /'00001.info.json').is_file()
-        if not some_data:
+        some_data = self.has_data()
+        if self.update and self.cache.exists():
+            self.update_data()
+        elif self.stream:
+            self.stream_data()
+        elif self.workers:
+            self.download_data_parallel()
+        elif not some_data:
             self.download_data()
-        some_data = (self.raw /'00001.info.json').is_file()
+        some_data = self.has_data()
         if some_data:
             self.start_analysis()
         else:
@@ -382,13 +779,72 @@ class Analysis:
 if __name__ == '__main__':
     logger.info('Welcome!')
     parser = argparse.ArgumentParser()
-    parser.add_argument('-t', '--takeout', required=True,
+    parser.add_argument('-t', '--takeout',
                         help='Path to an unzipped Takeout folder downloaded from https://takeout.google.com/')
     parser.add_argument("-o", '--out', default='data',
                         help="Path to empty directory for data storage.")
     parser.add_argument('-n', '--name', default=getuser(), 
                         help='Name of analyses (e.g. jessime)')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Download with this many parallel workers. Reruns resume where the last one stopped.')
+    parser.add_argument('-s', '--store', action='store_true',
+                        help='With --workers, keep only the info.json keys the analysis uses, in one compressed file.')
+    parser.add_argument('--keep-keys', nargs='+',
+                        help='The info.json keys kept by --store. Defaults to the keys used by the analysis.')
+    parser.add_argument('-u', '--update', action='store_true',
+                        help='Only download and add the videos that are new since the last analysis.')
+    parser.add_argument('-e', '--export',
+                        help='Render the report into this directory as static files, instead of starting a server.')
+    parser.add_argument('-k', '--keywords', nargs='+', default=['funny'],
+                        help='Words to count in video descriptions (default: funny).')
+    parser.add_argument('--lazy-text', action='store_true',
+                        help="Don't load video descriptions until a metric needs them, to save memory.")
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='Profile each stage with cProfile, saving the stats and a json summary in ran/profile.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Download and analyze at the same time, exporting a partial report every minute.')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Estimate view deciles and the top channels and languages with fixed-size sketches.')
+    parser.add_argument('--retry-unavailable', type=float, default=UNAVAILABLE_TTL / 86400, metavar='DAYS',
+                        help='Days before unavailable (deleted, private...) videos are tried again (default: 30). '
+                             'A negative number never tries them again.')
+    parser.add_argument('--serve-only', action='store_true',
+                        help='Serve the report saved by the last run, without loading or analyzing any data.')
+    parser.add_argument('-b', '--batch', nargs='+', metavar='[NAME=]TAKEOUT',
+                        help='Analyze several Takeouts, downloading videos they share only once, and export each report.')
+    parser.add_argument('--processes', type=int,
+                        help='Number of processes reading json files, or with --batch, of users analyzed at once '
+                             '(default: the number of CPUs).')
     args = parser.parse_args()
-    analysis = Analysis(args.takeout, args.out, args.name)
+    unavailable_ttl = None if args.retry_unavailable < 0 else args.retry_unavailable * 86400
+    if args.batch:
+        for flag, value in (('--takeout', args.takeout), ('--update', args.update), ('--stream', args.stream),
+                            ('--serve-only', args.serve_only)):
+            if value:
+                parser.error(f'{flag} can\'t be used with --batch')
+        from batch import parse_takeouts, run_batch
+        run_batch(parse_takeouts(args.batch), args.out, args.workers or 8, args.processes, args.keywords,
+                  args.export, unavailable_ttl=unavailable_ttl, keep_keys=args.keep_keys or DEFAULT_KEYS,
+                  lazy_text=args.lazy_text, approximate=args.approximate, profile=args.profile)
+        sys.exit()
+    if args.serve_only:
+        from server import SavedReport, launch_web
+        saved = SavedReport(args.out, args.name)
+        if not saved.has_data():
+            parser.error(f'no saved report in {saved.ran}, run the analysis once without --serve-only')
+        launch_web(saved, reload=False)
+        sys.exit()
+    if args.takeout is None:
+        parser.error('one of --takeout or --batch is required')
+    keep_keys = args.keep_keys or (DEFAULT_KEYS if args.store else None)
+    analysis = Analysis(args.takeout, args.out, args.name, args.workers, keep_keys, args.update,
+                        processes=args.processes, keywords=args.keywords, lazy_text=args.lazy_text, profile=args.profile,
+                        stream=args.stream, approximate=args.approximate,
+                        unavailable_ttl=unavailable_ttl)
     analysis.run()
-    launch_web(analysis)
+    if args.export:
+        from report import export_report
+        export_report(analysis, args.export)
+    else:
+        from server import launch_web
+        launch_web(analysis)